@@ -1,24 +1,226 @@
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import date, datetime, timezone
+from pathlib import Path
+
 import streamlit as st
 import pandas as pd
-from datetime import datetime
-from supabase_config import init_supabase
-
-supabase = init_supabase()
-
-def load_data():
-    orders = supabase.table("orders").select("*").execute().data
-    payments = supabase.table("payment").select("*").execute().data
-    order_items = supabase.table("order_items").select("*").execute().data
-    products = supabase.table("products").select("*").execute().data
-    categories = supabase.table("categories").select("*").execute().data
-
-    return (
-        pd.DataFrame(orders),
-        pd.DataFrame(payments),
-        pd.DataFrame(order_items),
-        pd.DataFrame(products),
-        pd.DataFrame(categories),
-    )
+from supabase_config import get_supabase
+from catalog import load_catalog
+from rollups import SalesFacts, SalesRollup, get_sales_rollup
+
+supabase = get_supabase()
+
+# "rollups" (incremental), "postgres" (sql/dashboard_facts.sql) or "tables"
+# (a full streamed rebuild on every refresh, for local testing; both stream
+# on ANALYTICS_LOAD_WORKERS threads, see rollups.py)
+ANALYTICS_SOURCE = st.secrets.get("ANALYTICS_SOURCE", "rollups")
+# Shared snapshot: recomputed this often in the background (0 = only on demand)
+REFRESH_SECONDS = float(st.secrets.get("ANALYTICS_REFRESH_SECONDS", 300))
+# Also keep it on disk as Parquet, so restarts and other processes reuse it ("" = off)
+SNAPSHOT_DIR = st.secrets.get("ANALYTICS_SNAPSHOT_DIR", "")
+COHORT_MONTHS = 12  # retention columns shown per cohort
+GRANULARITIES = {"month": "Monthly", "day": "Daily"}
+
+
+@dataclass
+class DashboardMetrics:
+    """Everything the dashboard renders for one view (dates, category, granularity)."""
+    total_revenue: float = 0.0
+    total_orders: int = 0
+    status_counts: dict[str, int] = field(default_factory=dict)       # status -> orders
+    top_products: dict[str, int] = field(default_factory=dict)        # name -> units, best first
+    category_revenue: dict[str, float] = field(default_factory=dict)  # category name -> item revenue
+    sales_trend: dict[str, float] = field(default_factory=dict)       # "YYYY-MM" or "YYYY-MM-DD" -> sales
+    cohorts: dict[str, dict] = field(default_factory=dict)            # "YYYY-MM" -> customers, repeat_customers,
+                                                                      # active {months since first: customers}
+
+    @property
+    def avg_order_value(self) -> float:
+        return self.total_revenue / self.total_orders if self.total_orders > 0 else 0
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "DashboardMetrics":
+        top = sorted((data.get("top_products") or {}).items(), key=lambda kv: -kv[1])[:5]
+        return cls(
+            total_revenue=float(data.get("total_revenue") or 0),
+            total_orders=int(data.get("total_orders") or 0),
+            status_counts={str(k): int(v) for k, v in (data.get("status_counts") or {}).items()},
+            top_products={str(k): int(v) for k, v in top},
+            category_revenue={str(k): float(v) for k, v in (data.get("category_revenue") or {}).items()},
+            sales_trend={str(k): float(v) for k, v in sorted((data.get("sales_trend") or {}).items())},
+            cohorts=dict(sorted((data.get("cohorts") or {}).items())),
+        )
+
+
+def _category_of(catalog):
+    def category_of(product_id):
+        product = catalog.get(product_id)
+        return product.get("category_id") if product else None
+    return category_of
+
+
+def facts_from_tables() -> SalesFacts:
+    """Rebuild the facts from the tables, streamed a page at a time."""
+    rollup = SalesRollup(supabase)
+    rollup.refresh(_category_of(load_catalog(supabase)))
+    return rollup.facts()
+
+
+def facts_from_rollups() -> SalesFacts:
+    """Fold new orders into the shared rollup and read its facts."""
+    rollup = get_sales_rollup(supabase)
+    rollup.refresh(_category_of(load_catalog(supabase)))
+    return rollup.facts()
+
+
+def facts_from_postgres() -> SalesFacts:
+    """Let Postgres aggregate; only the per-day facts cross the wire."""
+    return SalesFacts.from_records(supabase.rpc("dashboard_facts").execute().data)
+
+
+def get_facts() -> SalesFacts:
+    if ANALYTICS_SOURCE == "postgres":
+        return facts_from_postgres()
+    if ANALYTICS_SOURCE == "tables":
+        return facts_from_tables()
+    return facts_from_rollups()
+
+
+def view_metrics(facts, start=None, end=None, category_id=None, granularity="month") -> DashboardMetrics:
+    """Dashboard metrics for one view of the facts."""
+    catalog = load_catalog(supabase)
+    return DashboardMetrics.from_dict(facts.metrics(
+        start, end, category_id, granularity,
+        product_name=lambda pid: (catalog.get(pid) or {}).get("name"),
+        category_names={str(c["id"]): c["name"] for c in catalog.categories},
+    ))
+
+
+@dataclass
+class AnalyticsSnapshot:
+    """Sales facts as computed at one moment, shared by every viewer."""
+    facts: SalesFacts
+    computed_at: datetime  # UTC
+
+    @property
+    def age_seconds(self) -> float:
+        return (datetime.now(timezone.utc) - self.computed_at).total_seconds()
+
+    def to_frame(self) -> pd.DataFrame:
+        df = self.facts.to_frame()
+        df["computed_at"] = pd.Timestamp(self.computed_at)
+        return df
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame) -> "AnalyticsSnapshot":
+        computed_at = df["computed_at"].iloc[0].to_pydatetime()
+        return cls(SalesFacts.from_frame(df.drop(columns="computed_at")), computed_at)
+
+
+class AnalyticsSnapshotCache:
+    """One dashboard snapshot per process instead of one computation per viewer.
+
+    The snapshot is recomputed every ``interval`` seconds by a background
+    thread, or on demand with :meth:`refresh`; concurrent refresh requests
+    share a single computation. With a ``path`` it is also written as
+    Parquet, and a newer file (from a restart or another process) is picked
+    up on the next read.
+    """
+
+    def __init__(self, compute, interval=300, path=None):
+        self._compute = compute
+        self.interval = interval
+        self.path = path
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._disk_mtime = None  # st_mtime_ns of the file as last read or written here
+        self.refreshes = 0
+        self.errors = 0
+        if interval > 0:
+            threading.Thread(target=self._loop, daemon=True, name="analytics-snapshot").start()
+
+    def get(self) -> AnalyticsSnapshot:
+        """Return the current snapshot, computing the first one if needed."""
+        snapshot = self._from_disk() or self._snapshot
+        return snapshot if snapshot is not None else self.refresh()
+
+    def refresh(self) -> AnalyticsSnapshot:
+        """Recompute the snapshot now, unless someone else just did."""
+        requested = datetime.now(timezone.utc)
+        with self._lock:
+            if self._snapshot is not None and self._snapshot.computed_at >= requested:
+                return self._snapshot
+            snapshot = AnalyticsSnapshot(self._compute(), datetime.now(timezone.utc))
+            self._snapshot = snapshot
+            self.refreshes += 1
+        if self.path:
+            self._to_disk(snapshot)
+        return snapshot
+
+    def _from_disk(self):
+        if not self.path:
+            return None
+        try:
+            modified = os.stat(self.path).st_mtime_ns
+        except OSError:
+            return None
+        if modified == self._disk_mtime:
+            return None  # the file we wrote or already read
+        self._disk_mtime = modified
+        current = self._snapshot
+        try:
+            snapshot = AnalyticsSnapshot.from_frame(pd.read_parquet(self.path))
+        except Exception:
+            return None
+        if current is None and self.interval > 0 and snapshot.age_seconds > self.interval:
+            return None  # too old to start from; compute a fresh one
+        with self._lock:
+            if self._snapshot is None or snapshot.computed_at > self._snapshot.computed_at:
+                self._snapshot = snapshot
+            return self._snapshot
+
+    def _to_disk(self, snapshot):
+        # Write then rename, so readers never see half a file
+        path = Path(self.path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(f".{os.getpid()}.tmp")
+        try:
+            snapshot.to_frame().to_parquet(tmp, index=False)
+            os.replace(tmp, path)
+            self._disk_mtime = os.stat(path).st_mtime_ns
+        except Exception:
+            with self._lock:
+                self.errors += 1
+
+    def _loop(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.refresh()
+            except Exception:
+                # Keep serving the previous snapshot; the next tick retries
+                with self._lock:
+                    self.errors += 1
+
+
+@st.cache_resource
+def get_snapshot_cache() -> AnalyticsSnapshotCache:
+    """Return the dashboard snapshot shared by every session in this process."""
+    path = Path(SNAPSHOT_DIR) / f"dashboard_{ANALYTICS_SOURCE}.parquet" if SNAPSHOT_DIR else None
+    return AnalyticsSnapshotCache(get_facts, interval=REFRESH_SECONDS, path=path)
+
+
+def _age(seconds):
+    if seconds < 60:
+        return "just now"
+    if seconds < 3600:
+        return f"{int(seconds // 60)} min ago"
+    if seconds < 86400:
+        return f"{int(seconds // 3600)} h ago"
+    return f"{int(seconds // 86400)} days ago"
 
 
 def show_analytics():
@@ -57,16 +259,28 @@ def show_analytics():
     st.title("Analytics Dashboard")
     st.caption("Gain insights into store performance and sales trends.")
 
-    orders_df, payments_df, items_df, products_df, categories_df = load_data()
+    cache = get_snapshot_cache()
+    snapshot = cache.get()
+    days = snapshot.facts.day_range
 
-    if orders_df.empty:
+    if days is None:
         st.warning("No data available yet. Add some orders first!")
+        _show_snapshot_age(cache, snapshot)
+        return
+
+    # === FILTERS ===
+    start, end, category_id, granularity = _show_filters(days)
+    metrics = view_metrics(snapshot.facts, start, end, category_id, granularity)
+
+    if not metrics.total_orders:
+        st.info("No orders match these filters.")
+        _show_snapshot_age(cache, snapshot)
         return
 
     # === METRICS ===
-    total_revenue = payments_df["amount"].sum() if not payments_df.empty else 0
-    total_orders = len(orders_df)
-    avg_order_value = total_revenue / total_orders if total_orders > 0 else 0
+    total_revenue = metrics.total_revenue
+    total_orders = metrics.total_orders
+    avg_order_value = metrics.avg_order_value
 
     # Card-like metrics
     col1, col2, col3 = st.columns(3)
@@ -105,34 +319,83 @@ def show_analytics():
 
     # === SALES BY STATUS ===
     st.subheader("🧾 Orders by Status")
-    if "status" in orders_df.columns:
-        status_counts = orders_df["status"].value_counts().reset_index()
-        status_counts.columns = ["Status", "Count"]
-        st.bar_chart(status_counts.set_index("Status")["Count"])
+    if metrics.status_counts:
+        status_counts = pd.Series(metrics.status_counts, name="Count").rename_axis("Status")
+        st.bar_chart(status_counts)
     else:
         st.info("No order status data found.")
 
     # === TOP SELLING PRODUCTS ===
-    if not items_df.empty and not products_df.empty:
-        merged = items_df.merge(products_df, left_on="product_id", right_on="id", how="left")
-        top_products = merged.groupby("name")["quantity"].sum().sort_values(ascending=False).head(5)
+    if metrics.top_products:
+        top_products = pd.Series(metrics.top_products, name="quantity").rename_axis("name")
         st.markdown("### 🏆 Top Selling Products")
         st.bar_chart(top_products)
     else:
         st.info("No sales data available yet for top products.")
 
-    # === MONTHLY SALES TREND ===
-    if "created_at" in orders_df.columns:
-        orders_df["created_at"] = pd.to_datetime(orders_df["created_at"], errors="coerce")
-        monthly_sales = (
-            orders_df.groupby(orders_df["created_at"].dt.to_period("M"))["total"]
-            .sum()
-            .rename_axis("Month")
-            .reset_index()
-        )
-        monthly_sales["Month"] = monthly_sales["Month"].astype(str)
-        st.markdown("### 📅 Monthly Sales Trend")
-        st.line_chart(monthly_sales.set_index("Month")["total"])
+    # === REVENUE BY CATEGORY ===
+    if metrics.category_revenue and category_id is None:
+        category_revenue = pd.Series(metrics.category_revenue, name="revenue").rename_axis("Category")
+        st.markdown("### 🗂️ Revenue by Category")
+        st.bar_chart(category_revenue)
+
+    # === SALES TREND ===
+    if metrics.sales_trend:
+        sales_trend = pd.Series(metrics.sales_trend, name="total")
+        st.markdown(f"### 📅 {GRANULARITIES[granularity]} Sales Trend")
+        st.line_chart(sales_trend.rename_axis(granularity.title()))
+
+    # === REPEAT-CUSTOMER COHORTS ===
+    if metrics.cohorts:
+        st.markdown("### 🔁 Repeat Customers by First-Order Month")
+        st.dataframe(_cohort_table(metrics.cohorts), width="stretch")
+        st.caption("Share of each cohort ordering again N months after their first order (all categories).")
 
     st.markdown("---")
-    st.caption(f"🕒 Last updated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+    _show_snapshot_age(cache, snapshot)
+
+
+def _show_filters(days):
+    """Date range, category and granularity pickers; returns the view's parameters."""
+    first, last = date.fromisoformat(days[0]), date.fromisoformat(days[1])
+    categories = load_catalog(supabase).categories
+    col1, col2, col3 = st.columns([2, 2, 1])
+    with col1:
+        picked = st.date_input("📆 Date range", (first, last), min_value=first, max_value=last,
+                               key="analytics_dates")
+    with col2:
+        names = ["All"] + [c["name"] for c in categories]
+        category = st.selectbox("🗂️ Category", names, key="analytics_category")
+    with col3:
+        granularity = st.radio("Trend", list(GRANULARITIES), format_func=GRANULARITIES.get,
+                               key="analytics_granularity")
+
+    # While a range is being picked only its first day is set
+    picked = picked if isinstance(picked, (list, tuple)) else (picked,)
+    start = picked[0].isoformat() if picked else None
+    end = picked[1].isoformat() if len(picked) > 1 else start
+    category_id = next((c["id"] for c in categories if c["name"] == category), None)
+    return start, end, category_id, granularity
+
+
+def _cohort_table(cohorts):
+    rows = {}
+    for cohort, c in cohorts.items():
+        row = {"Customers": c["customers"], "Repeat %": 100 * c["repeat_customers"] / c["customers"]}
+        for offset in range(1, COHORT_MONTHS + 1):
+            active = c["active"].get(offset)
+            row[f"M{offset}"] = 100 * active / c["customers"] if active else None
+        rows[cohort] = row
+    table = pd.DataFrame.from_dict(rows, orient="index").rename_axis("Cohort").dropna(axis=1, how="all")
+    percents = [column for column in table.columns if column != "Customers"]
+    return table.style.format("{:.0f}%", na_rep="", subset=percents)
+
+
+def _show_snapshot_age(cache, snapshot):
+    computed = snapshot.computed_at.astimezone().strftime("%Y-%m-%d %H:%M:%S")
+    col1, col2 = st.columns([4, 1])
+    with col1:
+        schedule = f" · refreshed every {cache.interval / 60:g} min" if cache.interval > 0 else ""
+        st.caption(f"🕒 Data as of {computed} ({_age(snapshot.age_seconds)}){schedule}")
+    with col2:
+        st.button("🔄 Refresh now", on_click=cache.refresh)
@@ -1,12 +1,20 @@
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import jwt
 import streamlit as st
-from supabase_config import init_supabase
+from supabase_config import get_session_supabase, SUPABASE_URL, SUPABASE_KEY
 from supabase_auth.errors import AuthApiError
 
+REFRESH_MARGIN_SECONDS = int(st.secrets.get("AUTH_REFRESH_MARGIN_SECONDS", 120))
+JWKS_TTL_SECONDS = int(st.secrets.get("AUTH_JWKS_TTL_SECONDS", 600))
+# Only needed for projects still signing tokens with the legacy HS256 secret
+JWT_SECRET = st.secrets.get("SUPABASE_JWT_SECRET")
 
-supabase = init_supabase()
 
 def signup(email: str, password: str, full_name: str = None):
     """Sign up user — profile will be auto-created by trigger."""
+    supabase = get_session_supabase()
     try:
         res = supabase.auth.sign_up({
             "email": email,
@@ -30,6 +38,7 @@ def signup(email: str, password: str, full_name: str = None):
 
 def login(email: str, password: str):
     """Sign in using password (returns session / user)."""
+    supabase = get_session_supabase()
     try:
         res = supabase.auth.sign_in_with_password({"email": email, "password": password})
         user = getattr(res, "user", None)
@@ -37,12 +46,14 @@ def login(email: str, password: str):
         if not user:
             return {"error": "Login failed. Please try again."}
 
-        # ✅ ensure user profile exists
-        supabase.table("users").upsert({
-            "id": user.id,
-            "email": user.email,
-            "full_name": user.user_metadata.get("full_name", "User")
-        }).execute()
+        if session:
+            _remember_session(session)
+
+        # ✅ ensure profile + read it + stamp last_login, all in one call
+        try:
+            _cache_profile(user.id, _load_profile(supabase))
+        except Exception:
+            pass  # get_profile retries in the background on the next rerun
 
         return {"session": session, "user": user}
 
@@ -60,23 +71,140 @@ def login(email: str, password: str):
 def logout():
     """Sign out the current user."""
     try:
-        supabase.auth.sign_out()
+        get_session_supabase().auth.sign_out()
     except Exception:
         pass
-    st.session_state.pop("user", None)
+    _forget_session()
+    st.session_state["anonymous"] = True
+
+
+@st.cache_resource
+def _jwks_client():
+    """Project signing keys (JWKS), fetched once and shared by every session."""
+    return jwt.PyJWKClient(
+        f"{SUPABASE_URL}/auth/v1/.well-known/jwks.json",
+        lifespan=JWKS_TTL_SECONDS,
+        headers={"apikey": SUPABASE_KEY},
+    )
+
+
+def verify_token(token: str) -> dict:
+    """Validate an access token locally and return its claims.
+
+    Raises ``jwt.InvalidTokenError`` if the token is expired or forged, and
+    ``jwt.PyJWKClientError`` if its signing key isn't among the project's.
+    """
+    alg = jwt.get_unverified_header(token).get("alg")
+    if alg == "HS256":
+        if not JWT_SECRET:
+            # Can't check the signature offline; the token came from our own sign-in
+            return jwt.decode(token, options={"verify_signature": False, "verify_exp": True})
+        key = JWT_SECRET
+    else:
+        try:
+            key = _jwks_client().get_signing_key_from_jwt(token).key
+        except jwt.PyJWKClientConnectionError:
+            # Signing keys unreachable; as above, the token came from our own sign-in
+            return jwt.decode(token, options={"verify_signature": False, "verify_exp": True})
+    return jwt.decode(token, key, algorithms=[alg], audience="authenticated")
+
+
+def _remember_session(session):
+    st.session_state["auth_session"] = {
+        "access_token": session.access_token,
+        "refresh_token": session.refresh_token,
+        "expires_at": session.expires_at or 0,
+    }
+    st.session_state["user"] = session.user
+    st.session_state.pop("anonymous", None)
+
+
+def _forget_session():
+    for key in ("auth_session", "user", "profile", "_profile_polling"):
+        st.session_state.pop(key, None)
 
 
 def get_current_user():
-    """Return the current user from Streamlit session_state or Supabase."""
-    if "user" in st.session_state:
-        return st.session_state["user"]
+    """Return the current user without a network call on the common path.
+
+    The access token is checked locally against the cached signing keys and
+    refreshed shortly before it expires; anonymous sessions are remembered
+    so they are not looked up again on every rerun.
+    """
+    auth = st.session_state.get("auth_session")
+    if auth:
+        if auth["expires_at"] - time.time() < REFRESH_MARGIN_SECONDS:
+            try:
+                res = get_session_supabase().auth.refresh_session(auth["refresh_token"])
+                _remember_session(res.session)
+                auth = st.session_state["auth_session"]
+            except AuthApiError:
+                # The refresh token was revoked or already used
+                _forget_session()
+                st.session_state["anonymous"] = True
+                return None
+            except Exception:
+                pass  # auth unreachable: keep the session and retry on the next rerun
+        try:
+            verify_token(auth["access_token"])
+        except jwt.ExpiredSignatureError:
+            return None  # not refreshed yet; the refresh token is still good
+        except jwt.PyJWTError:
+            _forget_session()
+            st.session_state["anonymous"] = True
+            return None
+        return st.session_state.get("user")
+
+    if st.session_state.get("anonymous"):
+        return None
 
     try:
-        res = supabase.auth.get_user()
-        user = getattr(res, "user", None)
-        if user:
-            st.session_state["user"] = user
-            return user
+        session = get_session_supabase().auth.get_session()
+        if session:
+            _remember_session(session)
+            return session.user
     except Exception:
         pass
+    st.session_state["anonymous"] = True
     return None
+
+
+@st.cache_resource
+def _profile_pool():
+    return ThreadPoolExecutor(max_workers=4, thread_name_prefix="profile")
+
+
+def _load_profile(client):
+    """Ensure the profile exists, stamp last_login and return it (sql/login_profile.sql).
+
+    The returned profile is as it was before this login.
+    """
+    return client.rpc("login_profile").execute().data
+
+
+def _cache_profile(user_id, profile):
+    future = Future()
+    future.set_result(profile)
+    st.session_state["profile"] = {"user_id": user_id, "future": future}
+
+
+def get_profile(user):
+    """Return ``(profile, loading)`` for the logged-in user without blocking.
+
+    login() already caches the profile; sessions restored any other way
+    fetch it once in the background (which also stamps last_login).
+    ``profile`` is None while loading. A failed fetch raises once and is
+    retried on the next call.
+    """
+    entry = st.session_state.get("profile")
+    if not entry or entry["user_id"] != user.id:
+        future = _profile_pool().submit(_load_profile, get_session_supabase())
+        entry = st.session_state["profile"] = {"user_id": user.id, "future": future}
+
+    future = entry["future"]
+    if not future.done():
+        return None, True
+
+    if future.exception() is not None:
+        st.session_state.pop("profile", None)
+    return future.result(), False
@@ -0,0 +1,250 @@
+# benchmark.py
+"""Headless load benchmark for the shop, checkout and analytics flows.
+
+Drives main.py through Streamlit's AppTest against the in-memory Supabase
+(memory_backend.py) seeded with a catalog and order history of the
+requested size, optionally with simulated network latency, and
+reports per-rerun latency percentiles, Supabase round-trips per
+interaction and peak Python memory per scenario.
+
+    python benchmark.py --products 5000 --orders 50000 --iterations 30
+    python benchmark.py --latency-ms 40 --scenarios shop,checkout
+    python benchmark.py --json results.json --set GRID_PAGE_SIZE=48
+
+Latencies include AppTest's own overhead and tracemalloc's, so compare
+runs against each other rather than against production numbers.
+"""
+import argparse
+import json
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import defaultdict
+from pathlib import Path
+
+from memory_backend import ITEMS, WORDS, add_random_order
+
+APP = Path(__file__).with_name("main.py")
+PASSWORD = "benchmark-password"
+
+
+def memory_store():
+    """The app's in-memory Supabase, once the first run has imported supabase_config."""
+    config = sys.modules.get("supabase_config")
+    return config.get_memory_store() if config else None
+
+
+# --- Measurement ---
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+class Recorder:
+    """Times interactions and counts the round-trips each one made."""
+
+    def __init__(self):
+        self.samples = defaultdict(list)      # (scenario, interaction) -> [ms]
+        self.round_trips = defaultdict(list)  # (scenario, interaction) -> [calls]
+        self.peak_memory = {}                 # scenario -> bytes
+        self.errors = []
+
+    @staticmethod
+    def _requests():
+        store = memory_store()
+        return store.requests if store else 0
+
+    def measure(self, scenario, interaction, at, action):
+        calls = self._requests()
+        start = time.perf_counter()
+        action()
+        self.samples[scenario, interaction].append((time.perf_counter() - start) * 1000)
+        self.round_trips[scenario, interaction].append(self._requests() - calls)
+        if at.exception:
+            self.errors.append((scenario, interaction, [e.value for e in at.exception]))
+
+    def report(self):
+        rows = []
+        for (scenario, interaction), ms in self.samples.items():
+            calls = self.round_trips[scenario, interaction]
+            rows.append({
+                "scenario": scenario,
+                "interaction": interaction,
+                "n": len(ms),
+                "p50_ms": percentile(ms, 50),
+                "p95_ms": percentile(ms, 95),
+                "p99_ms": percentile(ms, 99),
+                "max_ms": max(ms),
+                "round_trips": sum(calls) / len(calls),
+            })
+        return {
+            "interactions": rows,
+            "peak_memory_mb": {k: v / 2**20 for k, v in self.peak_memory.items()},
+            "errors": self.errors,
+        }
+
+
+def print_report(report):
+    header = f"{'scenario':<10} {'interaction':<18} {'n':>4} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9} {'trips':>6}"
+    print(header)
+    print("-" * len(header))
+    for r in report["interactions"]:
+        print(f"{r['scenario']:<10} {r['interaction']:<18} {r['n']:>4} {r['p50_ms']:>9.1f} {r['p95_ms']:>9.1f}"
+              f" {r['p99_ms']:>9.1f} {r['max_ms']:>9.1f} {r['round_trips']:>6.1f}")
+    print()
+    for scenario, mb in report["peak_memory_mb"].items():
+        print(f"peak memory ({scenario}): {mb:,.1f} MB")
+    catalog = report.get("catalog_memory")
+    if catalog:
+        print(f"catalog: {catalog['products']:,} products, {catalog['total_bytes'] / 2**20:,.1f} MB columnar,"
+              f" {catalog['bytes_per_product']:,.0f} bytes/product"
+              f" (row dicts: ~{catalog['row_dict_bytes_per_product']:,.0f} bytes/product)")
+    queue = report.get("checkout_queue")
+    if queue and queue["completed"] + queue["failed"] + queue["rejected"]:
+        print(f"checkout queue: {queue['completed']} placed, {queue['failed']} failed,"
+              f" {queue['retries']} retries, {queue['dead_letters']} dead-lettered")
+    for scenario, interaction, messages in report["errors"]:
+        print(f"❌ {scenario}/{interaction}: {messages[0]}")
+
+
+# --- Scenarios ---
+
+def _labelled(widgets, prefix):
+    return next((w for w in widgets if str(w.label).startswith(prefix)), None)
+
+
+def run_shop(new_app, rec, iterations, rng):
+    at = new_app()
+    words = WORDS + ITEMS
+    rec.measure("shop", "page rerun", at, at.run)
+    for i in range(iterations):
+        rec.measure("shop", "page rerun", at, at.run)
+        search = _labelled(at.sidebar.text_input, "🔍")
+        rec.measure("shop", "search", at, search.set_value(rng.choice(words) if i % 2 else "").run)
+        sort = _labelled(at.sidebar.selectbox, "↕️")
+        rec.measure("shop", "sort", at, sort.set_value(rng.choice(sort.options)).run)
+        more = _labelled(at.button, "⬇️ Load more")
+        if more:
+            rec.measure("shop", "load more", at, more.click().run)
+        add = [b for b in at.button if str(b.label).startswith("Add to Cart")]
+        if add:
+            rec.measure("shop", "add to cart", at, rng.choice(add).click().run)
+
+
+def run_checkout(new_app, rec, iterations, rng):
+    email = f"shopper{rng.randint(1, 10**9)}@example.com"
+    memory_store().add_user(email, PASSWORD, {"full_name": "Benchmark Shopper"})
+    at = new_app()
+    at.run()
+    at.text_input(key="login_email").set_value(email)
+    at.text_input(key="login_pw").set_value(PASSWORD)
+    rec.measure("checkout", "login", at, _labelled(at.button, "Login").click().run)
+    for _ in range(iterations):
+        rec.measure("checkout", "page rerun", at, at.run)
+        add = [b for b in at.button if str(b.label).startswith("Add to Cart")]
+        rec.measure("checkout", "add to cart", at, rng.choice(add).click().run)
+        pay = _labelled(at.button, "✅ Confirm & Pay")
+        if pay:
+            rec.measure("checkout", "place order", at, pay.click().run)
+            rec.measure("checkout", "order confirmed", at, lambda: _await_order(at))
+
+
+def _await_order(at, timeout=30):
+    """Rerun, as the status poll would, until the queued order has settled."""
+    deadline = time.monotonic() + timeout
+    while "checkout_job" in at.session_state and time.monotonic() < deadline:
+        time.sleep(0.01)
+        at.run()
+
+
+def run_analytics(new_app, rec, iterations, rng):
+    at = new_app()
+    at.run()
+    nav = _labelled(at.sidebar.selectbox, "Navigate")
+    rec.measure("analytics", "open dashboard", at, nav.set_value("Analytics").run)
+    for _ in range(iterations):
+        # A little new traffic between views, as on a live store
+        store = memory_store()
+        with store.lock:
+            for _ in range(rng.randint(0, 5)):
+                add_random_order(store.tables, rng)
+        rec.measure("analytics", "dashboard rerun", at, at.run)
+    refresh = _labelled(at.button, "🔄 Refresh now")
+    if refresh:
+        rec.measure("analytics", "refresh snapshot", at, refresh.click().run)
+
+
+SCENARIOS = {"shop": run_shop, "checkout": run_checkout, "analytics": run_analytics}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--products", type=int, default=1000)
+    parser.add_argument("--categories", type=int, default=12)
+    parser.add_argument("--orders", type=int, default=5000)
+    parser.add_argument("--iterations", type=int, default=20, help="interaction rounds per scenario")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="comma-separated subset to run")
+    parser.add_argument("--latency-ms", type=float, default=0,
+                        help="simulated network latency per Supabase request")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--set", action="append", default=[], metavar="KEY=VALUE",
+                        help="extra Streamlit secret for the app, e.g. GRID_PAGE_SIZE=48")
+    parser.add_argument("--json", help="also write the report to this file")
+    args = parser.parse_args(argv)
+
+    from streamlit.testing.v1 import AppTest
+
+    secrets = {
+        "SUPABASE_BACKEND": "memory",
+        "MEMORY_SEED_PRODUCTS": args.products,
+        "MEMORY_SEED_CATEGORIES": args.categories,
+        "MEMORY_SEED_ORDERS": args.orders,
+        "MEMORY_LATENCY_MS": args.latency_ms,
+        "IMAGE_CACHE_DIR": tempfile.mkdtemp(prefix="benchmark-images-"),
+    }
+    for item in args.set:
+        key, _, value = item.partition("=")
+        try:
+            secrets[key] = json.loads(value)  # numbers, true/false, lists
+        except ValueError:
+            secrets[key] = value
+
+    def new_app():
+        at = AppTest.from_file(str(APP), default_timeout=120)
+        at.secrets.update(secrets)
+        return at
+
+    rec = Recorder()
+    rng = random.Random(args.seed)
+    print(f"Seeding {args.products:,} products, {args.categories} categories, {args.orders:,} orders"
+          f" ({args.latency_ms:g} ms per request)\n")
+
+    # Cold start: the first session in the process seeds the store and fills every shared cache
+    at = new_app()
+    tracemalloc.start()
+    rec.measure("startup", "first page load", at, at.run)
+    rec.peak_memory["startup"] = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    for name in args.scenarios.split(","):
+        tracemalloc.start()
+        SCENARIOS[name.strip()](new_app, rec, args.iterations, rng)
+        rec.peak_memory[name.strip()] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    report = rec.report()
+    config, catalog = sys.modules["supabase_config"], sys.modules["catalog"]
+    report["catalog_memory"] = catalog.load_catalog(config.get_supabase()).memory_report()
+    if "order_queue" in sys.modules:
+        report["checkout_queue"] = sys.modules["order_queue"].get_order_queue().stats()
+    print_report(report)
+    if args.json:
+        Path(args.json).write_text(json.dumps(report, indent=2))
+    return 1 if report["errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,157 @@
+# cart.py
+import secrets
+import threading
+import time
+
+import streamlit as st
+import streamlit.components.v1 as components
+from supabase_config import get_session_supabase, get_supabase
+
+CART_PERSIST = bool(st.secrets.get("CART_PERSIST", True))
+CART_FLUSH_SECONDS = float(st.secrets.get("CART_FLUSH_SECONDS", 2))
+CART_COOKIE = "cart_token"
+CART_COOKIE_DAYS = 30
+
+
+class CartWriter:
+    """Coalesces cart saves from every session and writes them in the background.
+
+    Only the latest state of each cart is kept, so a cart edited ten times
+    between flushes costs one write (see sql/carts.sql). Flushes run one at
+    a time, so once :meth:`flush` returns no write for that owner is still
+    in flight — callers rely on this before the session's auth changes.
+    """
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._pending = {}  # owner -> (client, anon_token, items)
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self.writes = 0
+        threading.Thread(target=self._loop, daemon=True, name="cart-writer").start()
+
+    def enqueue(self, owner, client, anon_token, items):
+        with self._lock:
+            self._pending[owner] = (client, anon_token, dict(items))
+
+    def flush(self, owner=None):
+        """Write pending carts now — all of them, or just ``owner``'s."""
+        with self._write_lock:
+            with self._lock:
+                if owner is None:
+                    batch, self._pending = self._pending, {}
+                else:
+                    batch = {owner: self._pending.pop(owner)} if owner in self._pending else {}
+
+            for client, anon_token, items in batch.values():
+                try:
+                    client.rpc("save_cart", {"p_items": items, "p_anon_token": anon_token}).execute()
+                    with self._lock:
+                        self.writes += 1
+                except Exception:
+                    pass  # the next edit queues the whole cart again
+
+    def _loop(self):
+        while True:
+            time.sleep(self.interval)
+            self.flush()
+
+
+@st.cache_resource
+def get_cart_writer() -> CartWriter:
+    return CartWriter(CART_FLUSH_SECONDS)
+
+
+def _write_cookie(token):
+    # Streamlit can read cookies but not set them; a same-origin component can
+    components.html(
+        f"""<script>
+        document.cookie = "{CART_COOKIE}={token}; path=/; max-age={CART_COOKIE_DAYS * 86400}; SameSite=Strict"
+            + (location.protocol === "https:" ? "; Secure" : "");
+        </script>""",
+        height=0,
+    )
+
+
+def _anon_token():
+    """Random token naming this browser's anonymous cart, kept in a cookie so it survives reconnects.
+
+    Never in the URL: anyone holding the token can read and claim the cart.
+    """
+    st.query_params.pop("cart", None)  # links from before the cookie
+    token = st.session_state.get("cart_token") or st.context.cookies.get(CART_COOKIE)
+    # A token merged into an account this session is spent, though the browser still sends it
+    if not token or len(token) < 32 or token == st.session_state.get("cart_token_merged"):
+        token = secrets.token_urlsafe(32)
+        st.session_state["cart_token_is_new"] = True
+        _write_cookie(token)
+    return token
+
+
+def _cart_client(anon_token):
+    """Client for this cart's reads and writes.
+
+    Anonymous carts use the shared client, which is never signed in, so a
+    write queued before login can't land in the user's cart afterwards.
+    """
+    return get_supabase() if anon_token else get_session_supabase()
+
+
+def init_cart(user):
+    """Return the session cart ``{product_id: quantity}``, loading it from the server once."""
+    anon_token = None if user else _anon_token()
+    owner = f"user:{user.id}" if user else f"anon:{anon_token}"
+
+    if st.session_state.get("cart_owner") != owner:
+        items = {}
+        if CART_PERSIST and not st.session_state.pop("cart_token_is_new", False):
+            try:
+                items = _cart_client(anon_token).rpc(
+                    "load_cart", {"p_anon_token": anon_token}
+                ).execute().data or {}
+            except Exception:
+                items = {}
+        st.session_state.cart = {str(pid): int(qty) for pid, qty in items.items()}
+        st.session_state.cart_owner = owner
+        st.session_state.cart_token = anon_token
+    return st.session_state.cart
+
+
+def cart_changed():
+    """Queue the session cart for the next background write."""
+    if CART_PERSIST and "cart_owner" in st.session_state:
+        get_cart_writer().enqueue(
+            st.session_state.cart_owner,
+            _cart_client(st.session_state.cart_token),
+            st.session_state.cart_token,
+            st.session_state.cart,
+        )
+
+
+def flush_cart():
+    """Write this session's pending cart now; call before signing out."""
+    if CART_PERSIST and "cart_owner" in st.session_state:
+        get_cart_writer().flush(st.session_state.cart_owner)
+
+
+def merge_anonymous_cart(user):
+    """After login, fold the anonymous cart into the user's saved cart."""
+    anon_token = st.session_state.get("cart_token")
+    if not anon_token:
+        return
+    anon_cart = dict(st.session_state.get("cart", {}))
+
+    merged = anon_cart
+    if CART_PERSIST:
+        get_cart_writer().flush(f"anon:{anon_token}")
+        try:
+            merged = get_session_supabase().rpc(
+                "merge_cart", {"p_anon_token": anon_token}
+            ).execute().data or anon_cart
+        except Exception:
+            pass
+
+    st.session_state.cart = {str(pid): int(qty) for pid, qty in merged.items()}
+    st.session_state.cart_owner = f"user:{user.id}"
+    st.session_state.cart_token = None
+    st.session_state["cart_token_merged"] = anon_token
@@ -0,0 +1,277 @@
+# catalog.py
+import itertools
+import threading
+import time
+from collections.abc import Mapping
+
+import numpy as np
+import streamlit as st
+
+from postgrest.exceptions import APIError
+
+from grid import GRID_COLUMNS
+from pricing import PricingRule
+from product_columns import ProductColumns
+from search import SearchIndex
+from supabase_config import fetch_pages
+
+
+class ProductLookup(Mapping):
+    """``{str(id): product}`` over the product columns, without a dict per row."""
+
+    def __init__(self, columns):
+        self._columns = columns
+
+    def __getitem__(self, product_id):
+        i = self._columns.position(product_id)
+        if i is None:
+            raise KeyError(product_id)
+        return self._columns.row(i)
+
+    def __iter__(self):
+        return (str(v) for v in self._columns.column_values("id")) if self._columns.size else iter(())
+
+    def __len__(self):
+        return self._columns.size
+
+
+# Every snapshot gets a new version; price snapshots (pricing.py) are keyed on it
+_versions = itertools.count(1)
+
+
+class Catalog:
+    """Snapshot of the categories and products tables with lookup indexes.
+
+    Built once per catalog load and shared read-only by every session.
+    Products are stored column-wise (product_columns.py); ``products`` and
+    every filtered list are views over those columns (``products`` may be
+    given as a ready :class:`ProductColumns`). Changes never mutate
+    a snapshot; :meth:`with_changes` derives a new one.
+    """
+
+    def __init__(self, categories, products, _search_index=None, pricing_rules=()):
+        self.version = next(_versions)
+        self.categories = categories
+        self.pricing_rules = tuple(pricing_rules)
+        self.columns = products if isinstance(products, ProductColumns) else ProductColumns(products)
+        self.products = self.columns.view()
+        self.by_id = ProductLookup(self.columns)
+        self.category_by_name = {c["name"]: c for c in categories}
+        self.search_index = _search_index or SearchIndex(self.by_id)
+        if "price" in self.columns.numeric and self.columns.size:
+            prices = np.nan_to_num(self.columns.numeric["price"])
+            self.price_range = (float(prices.min()), float(prices.max()))
+        else:
+            prices = [p.get("price") or 0 for p in self.products]
+            self.price_range = (min(prices), max(prices)) if prices else (0, 0)
+
+    def get(self, product_id):
+        """Return the product with this id (str or int), or None."""
+        return self.by_id.get(str(product_id))
+
+    def view_of(self, product_ids):
+        """The products with these ids, in the given order."""
+        positions = (self.columns.position(pid) for pid in product_ids)
+        return self.columns.view([i for i in positions if i is not None])
+
+    def in_category(self, category_id, products=None):
+        """Products (of ``products``, default all) in one category, order kept."""
+        products = self.products if products is None else products
+        if "category_id" in self.columns.numeric:
+            return products.where(products.numbers("category_id") == category_id)
+        return products.where(np.array([p.get("category_id") == category_id for p in products], dtype=bool))
+
+    def memory_report(self):
+        return self.columns.memory_report()
+
+    def with_changes(self, changes):
+        """Return a new Catalog with row changes applied.
+
+        ``changes`` is a list of ``(table, type, record, old_record)`` with
+        type INSERT, UPDATE or DELETE. The product columns are patched at
+        the changed rows (updated rows keep their position) and the search
+        index only re-indexes those rows.
+        """
+        categories = {str(c["id"]): c for c in self.categories}
+        products = {}  # str(id) -> latest record, None once deleted
+        for table, kind, record, old in changes:
+            if table not in ("products", "categories"):
+                continue
+            key = str((old if kind == "DELETE" else record)["id"])
+            if table == "categories":
+                if kind == "DELETE":
+                    categories.pop(key, None)
+                else:
+                    categories[key] = record
+            else:
+                products[key] = None if kind == "DELETE" else record
+
+        removed = [p for key in products if (p := self.by_id.get(key)) is not None]
+        added = [r for r in products.values() if r is not None]
+        columns = self.columns.with_changes(added, [k for k, r in products.items() if r is None])
+        search_index = self.search_index.with_changes(ProductLookup(columns), removed, added)
+        return Catalog(list(categories.values()), columns, search_index, self.pricing_rules)
+
+
+class CatalogCache:
+    """Process-wide cache of the categories and products tables.
+
+    Fresh data (younger than ``ttl``) is served straight from memory. Once it
+    goes stale it is still served for up to ``max_stale`` more seconds while a
+    background thread reloads it, so reruns never wait on Supabase unless the
+    cache is empty or far too old — and then every waiting session shares
+    one load. While a change feed is attached
+    (catalog_feed.py) the data is patched in place and never expires.
+    """
+
+    def __init__(self, loader, ttl=300, max_stale=3600):
+        self._loader = loader
+        self.ttl = ttl
+        self.max_stale = max_stale
+        self._lock = threading.Lock()
+        self._miss_lock = threading.Lock()  # one blocking load at a time
+        self._data = None
+        self._loaded_at = 0.0
+        self._refreshing = False
+        self.hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.errors = 0
+        self.changes_applied = 0
+        # Set while a change feed keeps the data current; TTL reloads are skipped
+        self.live = False
+        # One list per load in progress: changes that arrive while it runs
+        self._buffers = []
+
+    def get(self):
+        """Return the current :class:`Catalog`."""
+        with self._lock:
+            data = self._data
+            age = time.monotonic() - self._loaded_at
+
+            if data is not None and (self.live or age < self.ttl):
+                self.hits += 1
+                return data
+
+            if data is not None and age < self.ttl + self.max_stale:
+                # ♻️ Serve stale data and refresh behind the scenes
+                self.hits += 1
+                if not self._refreshing:
+                    self._refreshing = True
+                    threading.Thread(target=self._refresh, daemon=True).start()
+                return data
+
+            self.misses += 1
+
+        with self._miss_lock:
+            # Sessions that missed together wait for the first one's load
+            with self._lock:
+                data = self._data
+                if data is not None and (self.live or time.monotonic() - self._loaded_at < self.ttl + self.max_stale):
+                    return data
+            return self._load()
+
+    def invalidate(self):
+        """Drop the cached catalog so the next read reloads it."""
+        with self._lock:
+            self._data = None
+            self._loaded_at = 0.0
+
+    def reload(self):
+        """Reload the catalog now, in the calling thread."""
+        self._load()
+        with self._lock:
+            self.refreshes += 1
+
+    def apply_changes(self, changes):
+        """Patch the cached catalog with row changes from a change feed.
+
+        Loads in progress also keep them, and replay them on the snapshot
+        they fetched, which may predate some of these changes.
+        """
+        with self._lock:
+            for buffer in self._buffers:
+                buffer.extend(changes)
+            if self._data is None:
+                return
+            self._data = self._data.with_changes(changes)
+            self.changes_applied += len(changes)
+
+    def stats(self):
+        with self._lock:
+            age = time.monotonic() - self._loaded_at if self._data is not None else None
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "refreshes": self.refreshes,
+                "errors": self.errors,
+                "changes_applied": self.changes_applied,
+                "live": self.live,
+                "age_seconds": age,
+            }
+
+    def _load(self):
+        buffer = []
+        with self._lock:
+            self._buffers.append(buffer)
+        try:
+            data = self._loader()
+        except Exception:
+            with self._lock:
+                self._buffers.remove(buffer)
+            raise
+        with self._lock:
+            self._buffers.remove(buffer)
+            if buffer:
+                # Replaying is safe: a change already in the snapshot just rewrites the same row
+                data = data.with_changes(buffer)
+            self._data = data
+            self._loaded_at = time.monotonic()
+        return data
+
+    def _refresh(self):
+        try:
+            self._load()
+            with self._lock:
+                self.refreshes += 1
+        except Exception:
+            # Keep serving the stale copy; the next read past the TTL retries
+            with self._lock:
+                self.errors += 1
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+
+def _fetch_catalog(supabase):
+    categories = supabase.table("categories").select("*").execute().data
+    # Paged: a single select stops at PostgREST's max-rows
+    request = lambda: supabase.table("products").select(GRID_COLUMNS).order("id")
+    products = [row for page in fetch_pages(request) for row in page]
+    try:
+        rules = (
+            supabase.table("pricing_rules").select("*").eq("active", True)
+            .order("position").order("id").execute().data
+        )
+    except APIError:
+        rules = []  # sql/pricing.sql not installed yet
+    return Catalog(categories, products, pricing_rules=[PricingRule.from_row(r) for r in rules])
+
+
+@st.cache_resource
+def get_catalog_cache(_supabase) -> CatalogCache:
+    """Return the catalog cache shared by every session in this process."""
+    return CatalogCache(
+        lambda: _fetch_catalog(_supabase),
+        ttl=float(st.secrets.get("CATALOG_TTL_SECONDS", 300)),
+        max_stale=float(st.secrets.get("CATALOG_MAX_STALE_SECONDS", 3600)),
+    )
+
+
+def load_catalog(supabase) -> Catalog:
+    """Return the cached, indexed catalog."""
+    return get_catalog_cache(supabase).get()
+
+
+def invalidate_catalog(supabase):
+    get_catalog_cache(supabase).invalidate()
@@ -0,0 +1,112 @@
+# catalog_feed.py
+import asyncio
+import queue
+import threading
+
+import streamlit as st
+from realtime import AsyncRealtimeClient, RealtimeSubscribeStates
+
+from catalog import get_catalog_cache
+from grid import GRID_COLUMNS
+from supabase_config import SUPABASE_URL, SUPABASE_KEY
+
+CATALOG_FEED = st.secrets.get("CATALOG_FEED", "off")  # "realtime" or "off"
+BATCH_SECONDS = float(st.secrets.get("CATALOG_FEED_BATCH_SECONDS", 0.5))
+
+_PRODUCT_COLUMNS = GRID_COLUMNS.split(",")
+
+
+class CatalogFeed:
+    """Applies product/category row changes to the shared catalog cache.
+
+    Changes are queued by :meth:`publish` and applied in small batches on a
+    worker thread, so a burst of edits produces one new catalog snapshot
+    instead of one per row.
+    """
+
+    def __init__(self, cache):
+        self.cache = cache
+        self._queue = queue.Queue()
+        threading.Thread(target=self._apply_loop, daemon=True, name="catalog-feed").start()
+
+    def start(self):
+        self.cache.live = True
+
+    def publish(self, table, kind, record=None, old_record=None):
+        """Queue one change; ``kind`` is INSERT, UPDATE or DELETE."""
+        if table == "products" and record:
+            record = {k: record[k] for k in _PRODUCT_COLUMNS if k in record}
+        self._queue.put((table, kind, record, old_record))
+
+    def flush(self):
+        """Block until every queued change has been applied."""
+        self._queue.join()
+
+    def _apply_loop(self):
+        while True:
+            batch = [self._queue.get()]
+            try:
+                while True:
+                    batch.append(self._queue.get(timeout=BATCH_SECONDS))
+            except queue.Empty:
+                pass
+            try:
+                self.cache.apply_changes(batch)
+            except Exception:
+                # Don't trust a half-applied catalog; fall back to reloading
+                self.cache.live = False
+                self.cache.invalidate()
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+
+class RealtimeCatalogFeed(CatalogFeed):
+    """Listens to Supabase Realtime for changes to products and categories.
+
+    Needs the tables in the supabase_realtime publication
+    (sql/catalog_realtime.sql). Until the channel is subscribed, and after
+    it drops, the cache falls back to its normal TTL refresh.
+    """
+
+    def start(self):
+        threading.Thread(
+            target=lambda: asyncio.run(self._listen()), daemon=True, name="catalog-realtime"
+        ).start()
+
+    async def _listen(self):
+        client = AsyncRealtimeClient(f"{SUPABASE_URL}/realtime/v1", token=SUPABASE_KEY)
+        await client.connect()
+        channel = client.channel("catalog-changes")
+        for table in ("products", "categories"):
+            channel.on_postgres_changes("*", table=table, schema="public", callback=self._on_change)
+        await channel.subscribe(self._on_state)
+        await asyncio.Event().wait()  # the client's own tasks do the listening
+
+    def _on_state(self, state, error):
+        if state == RealtimeSubscribeStates.SUBSCRIBED:
+            # Catch up on anything missed while disconnected, then trust the feed
+            threading.Thread(target=self._resync, daemon=True).start()
+        else:
+            self.cache.live = False
+
+    def _resync(self):
+        try:
+            self.cache.reload()
+            self.cache.live = True
+        except Exception:
+            self.cache.live = False
+
+    def _on_change(self, payload):
+        data = payload["data"]
+        self.publish(data["table"], data["type"], data.get("record"), data.get("old_record"))
+
+
+@st.cache_resource
+def start_catalog_feed(_supabase):
+    """Start the configured change feed once per process (None when off)."""
+    if CATALOG_FEED != "realtime":
+        return None
+    feed = RealtimeCatalogFeed(get_catalog_cache(_supabase))
+    feed.start()
+    return feed
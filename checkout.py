@@ -1,84 +1,158 @@
 # checkout.py
+import json
+import uuid
+
 import streamlit as st
-from supabase_config import init_supabase
+from supabase_config import get_session_supabase, get_supabase
 from auth_helpers import get_current_user
+from cart import cart_changed
+from catalog import invalidate_catalog
+from order_queue import CHECKOUT_POLL_SECONDS, QueueFull, get_order_queue
+from pricing import price_cart
+
+def checkout_key(snapshot):
+    """Idempotency key for ordering exactly this priced cart.
+
+    Derived from the session's checkout nonce and the snapshot's items and
+    total: a double-click, a worker retry or a retry after a dropped
+    response sends the same key, while an edited cart gets a new one and
+    can't be mistaken for an order already placed. The nonce changes after
+    each successful order, so the same cart can be bought again.
+    """
+    nonce = st.session_state.setdefault("checkout_nonce", str(uuid.uuid4()))
+    order = json.dumps([snapshot.items(), snapshot.total], sort_keys=True)
+    return str(uuid.uuid5(uuid.UUID(nonce), order))
+
+
+def place_order(snapshot, payment_method):
+    """Queue the order, its items and the payment as one atomic RPC call.
+
+    Returns the queued job at once; order_queue.py's workers place it. The
+    idempotency key (:func:`checkout_key`) makes a repeat of the same order
+    return the first one instead of placing another. The snapshot's unit
+    prices and total go along, and the server refuses the order if they are
+    out of date. See sql/place_order.sql.
+    """
+    key = checkout_key(snapshot)
+    return get_order_queue().submit(get_session_supabase(), {
+        "p_idempotency_key": key,
+        "p_items": snapshot.items(),
+        "p_payment_method": payment_method,
+        "p_expected_total": snapshot.total,
+    })
+
+
+def _submit_order(snapshot):
+    """Confirm & Pay callback: queue the order; the rerun that follows shows its progress."""
+    try:
+        job = place_order(snapshot, st.session_state["payment_method"])
+    except QueueFull:
+        st.session_state["checkout_notice"] = (
+            "warning", "🚦 Checkout is very busy right now. Please try again in a moment."
+        )
+        return
+    st.session_state["checkout_job"] = job.id
+
+
+def _settle_order(cart, job):
+    """Apply a finished (or lost) checkout job to the session."""
+    st.session_state.pop("checkout_job", None)
+
+    if job is None:
+        # The server restarted or the job expired; the key makes a retry safe
+        st.session_state["checkout_notice"] = (
+            "warning", "We couldn't confirm your order. Please try again — you won't be charged twice."
+        )
+        return
+
+    if job.status == "done":
+        # 4️⃣ Remove what was ordered (anything added meanwhile stays)
+        for item in job.params["p_items"]:
+            left = cart.get(item["product_id"], 0) - item["quantity"]
+            if left > 0:
+                cart[item["product_id"]] = left
+            else:
+                cart.pop(item["product_id"], None)
+        cart_changed()
+        st.session_state.pop("checkout_nonce", None)
+        if (job.result or {}).get("duplicate"):
+            st.session_state["checkout_notice"] = ("info", "This order was already placed — no second charge was made.")
+        else:
+            st.session_state["checkout_notice"] = ("success", "🎉 Payment successful! Your order has been placed.")
+        return
+
+    if "Prices changed" in (job.error or ""):
+        # 🔄 Our catalog is out of date: reload it and show the new total.
+        # A full rerun, since the fragment keeps the catalog it was given.
+        invalidate_catalog(get_supabase())
+        st.session_state["prices_changed"] = True
+        st.rerun()
+    st.session_state["checkout_notice"] = ("error", f"❌ Error processing payment: {job.error}")
+
+
+def _show_order_progress(job_id):
+    """Poll the queued order; refresh the page once it has finished."""
+    job = get_order_queue().get(job_id)
+    if job is None or job.finished:
+        st.rerun()
+    if job.status == "retrying":
+        st.info(f"⏳ Still placing your order… (attempt {job.attempts + 1})")
+    else:
+        st.info("⏳ Placing your order…")
 
-supabase = init_supabase()
 
-def show_checkout(cart, products_all):
-    """Handles checkout, authentication, order creation, and payment."""
-    st.sidebar.divider()
-    st.sidebar.subheader("💳 Checkout")
+def checkout_pending():
+    """True while a queued order or its outcome still has to be shown, even for an empty cart."""
+    return "checkout_job" in st.session_state or "checkout_notice" in st.session_state
+
+
+def show_checkout(cart, catalog):
+    """Handles checkout, authentication, order creation, and payment.
+
+    Renders into the current container (the sidebar cart fragment).
+    """
+    st.divider()
+    st.subheader("💳 Checkout")
 
     user = get_current_user()
 
+    # 📨 An order is in the queue: show its progress until it finishes
+    job_id = st.session_state.get("checkout_job")
+    if job_id:
+        job = get_order_queue().get(job_id)
+        if job is not None and not job.finished:
+            st.fragment(run_every=CHECKOUT_POLL_SECONDS)(_show_order_progress)(job_id)
+            return
+        _settle_order(cart, job)
+
+    notice = st.session_state.pop("checkout_notice", None)
+    if notice:
+        level, message = notice
+        getattr(st, level)(message)
+
     # 🛒 Empty cart
     if not cart:
-        st.sidebar.info("Your cart is empty. Add some items to continue.")
+        st.info("Your cart is empty. Add some items to continue.")
         return
 
     # 🚫 Require login before payment
     if not user:
-        st.sidebar.warning("Please **log in or create an account** from the sidebar before making a payment.")
+        st.warning("Please **log in or create an account** from the sidebar before making a payment.")
         return
 
-    # 🧮 Compute total
-    total_price = 0
-    for pid, qty in cart.items():
-        product = next(
-            (p for p in products_all if str(p["id"]) == pid),
-            None
-        )
-        if product:
-            total_price += (product["price"] or 0) * qty
+    # 🧮 Price the cart (cached until the cart or the catalog changes)
+    snapshot = price_cart(cart, catalog)
+    if st.session_state.pop("prices_changed", False):
+        st.warning("⚠️ Prices have changed since you last looked. Please review your total.")
+    if snapshot.unavailable:
+        st.warning(f"{len(snapshot.unavailable)} item(s) in your cart are no longer available and won't be charged.")
 
-    st.sidebar.write(f"**🧾 Total Amount:** ₵ {total_price:,.2f}")
+    if snapshot.adjustments:
+        st.write(f"Subtotal: ₵ {snapshot.subtotal:,.2f}")
+        for label, amount in snapshot.adjustments:
+            st.write(f"{label}: ₵ {amount:,.2f}")
+    st.write(f"**🧾 Total Amount:** ₵ {snapshot.total:,.2f}")
 
     # 💰 Payment method selection
-    payment_method = st.sidebar.selectbox("Select Payment Method", ["Card", "Cash", "Mobile Money"])
-    confirm_payment = st.sidebar.button("✅ Confirm & Pay")
-
-    if confirm_payment:
-        try:
-            # 1️⃣ Create an order
-            order_response = supabase.table("orders").insert({
-                "user_id": user.id,
-                "total": total_price,
-                "status": "completed",
-                "payment_status": "paid"
-            }).execute()
-            order_id = order_response.data[0]["id"]
-
-            # 2️⃣ Add items to order
-            for pid, qty in cart.items():
-                product = next(
-                    (p for p in products_all if str(p["id"]) == pid),
-                    None
-                )
-                if product:
-                    price = product["price"] or 0
-                    subtotal = price * qty
-                    supabase.table("order_items").insert({
-                        "order_id": order_id,
-                        "product_id": product["id"],
-                        "quantity": qty,
-                        "price": price,
-                        "subtotal": subtotal
-                    }).execute()
-
-            # 3️⃣ Record payment
-            supabase.table("payment").insert({
-                "order_id": order_id,
-                "amount": total_price,
-                "method": payment_method,
-                "status": "paid",
-                "transaction_ref": f"TX-{order_id}-{user.id[:6]}"
-            }).execute()
-
-            # 4️⃣ Clear cart
-            cart.clear()
-            st.sidebar.success("🎉 Payment successful! Your order has been placed.")
-            st.rerun()
-
-        except Exception as e:
-            st.sidebar.error(f"❌ Error processing payment: {e}")
+    st.selectbox("Select Payment Method", ["Card", "Cash", "Mobile Money"], key="payment_method")
+    st.button("✅ Confirm & Pay", on_click=_submit_order, args=(snapshot,))
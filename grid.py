@@ -0,0 +1,151 @@
+# grid.py
+import numpy as np
+import streamlit as st
+
+from product_columns import ProductView
+
+GRID_BACKEND = st.secrets.get("GRID_BACKEND", "memory")  # "memory" or "postgres"
+PAGE_SIZE = int(st.secrets.get("GRID_PAGE_SIZE", 24))
+
+# Only the columns the product grid renders
+GRID_COLUMNS = "id,name,description,price,image_url,attribution,category_id"
+
+# Sort label -> (column, descending). Ties are always broken by id.
+SORTS = {
+    "Featured": ("id", False),
+    "Price: Low to High": ("price", False),
+    "Price: High to Low": ("price", True),
+    "Name: A to Z": ("name", False),
+}
+
+
+def _quote(value):
+    """Quote a value for use inside a PostgREST or=() filter."""
+    if isinstance(value, str):
+        return '"' + value.replace("\\", "\\\\").replace('"', '\\"') + '"'
+    return value
+
+
+def build_product_query(supabase, filters, after=None, page_size=PAGE_SIZE):
+    """Translate the shop filters into one filtered, projected, keyset-paged query.
+
+    ``filters`` has ``category_id``, ``search``, ``min_price``, ``max_price``
+    and ``sort`` (a key of SORTS). ``after`` is the ``(sort_value, id)`` of
+    the last row already shown.
+    """
+    column, desc = SORTS[filters.get("sort") or "Featured"]
+    request = supabase.table("products").select(GRID_COLUMNS)
+
+    if filters.get("category_id") is not None:
+        request = request.eq("category_id", filters["category_id"])
+    if filters.get("min_price") is not None:
+        request = request.gte("price", filters["min_price"])
+    if filters.get("max_price") is not None:
+        request = request.lte("price", filters["max_price"])
+
+    if after is not None:
+        value, last_id = after
+        op = "lt" if desc else "gt"
+        if column == "id":
+            request = request.filter("id", op, last_id)
+        elif value is None:
+            # Nulls sort last, so only more nulls can follow
+            request = request.is_(column, "null").gt("id", last_id)
+        else:
+            # ...and after the last non-null value come all the nulls
+            v = _quote(value)
+            request = request.or_(f"{column}.{op}.{v},and({column}.eq.{v},id.gt.{last_id}),{column}.is.null")
+
+    request = request.order(column, desc=desc, nullsfirst=False)
+    if column != "id":
+        request = request.order("id")
+    request = request.limit(page_size)
+
+    if filters.get("search"):
+        # Needs the fts column from sql/product_search.sql
+        request = request.text_search(
+            "fts", filters["search"], options={"type": "web_search", "config": "english"}
+        )
+    return request
+
+
+def apply_filters(products, filters):
+    """In-memory equivalent of the price range and sort in build_product_query."""
+    if isinstance(products, ProductView) and "price" in products.columns.numeric:
+        return _apply_filters_columnar(products, filters)
+
+    lo, hi = filters.get("min_price"), filters.get("max_price")
+    if lo is not None or hi is not None:
+        products = [
+            p for p in products
+            if (lo is None or (p.get("price") or 0) >= lo)
+            and (hi is None or (p.get("price") or 0) <= hi)
+        ]
+
+    sort = filters.get("sort") or "Featured"
+    if sort == "Featured":
+        return products
+    column, desc = SORTS[sort]
+    present = [p for p in products if p.get(column) is not None]
+    missing = [p for p in products if p.get(column) is None]
+    present.sort(key=lambda p: p[column], reverse=desc)
+    return present + missing
+
+
+def _apply_filters_columnar(products, filters):
+    """apply_filters on a catalog view: array masks and argsorts, no row objects."""
+    lo, hi = filters.get("min_price"), filters.get("max_price")
+    if lo is not None or hi is not None:
+        prices = np.nan_to_num(products.numbers("price"))  # NULL counts as 0, as above
+        mask = np.ones(len(prices), dtype=bool)
+        if lo is not None:
+            mask &= prices >= lo
+        if hi is not None:
+            mask &= prices <= hi
+        products = products.where(mask)
+
+    sort = filters.get("sort") or "Featured"
+    if sort == "Featured":
+        return products
+    column, desc = SORTS[sort]
+    return products.sorted_by(column, desc)
+
+
+def _grid_state(filter_key):
+    """Per-session paging state, reset whenever the filters change."""
+    state = st.session_state.get("grid")
+    if not state or state["key"] != filter_key:
+        state = st.session_state["grid"] = {
+            "key": filter_key,
+            "limit": PAGE_SIZE,
+            "rows": [],
+            "cursor": None,
+            "done": False,
+        }
+    return state
+
+
+def visible_products(supabase, products, filters, from_db=False):
+    """Return ``(rows_to_render, has_more)`` for the current page limit.
+
+    With ``from_db`` the rows come from keyset-paged Supabase queries built
+    by build_product_query; otherwise ``products`` is sliced in memory.
+    """
+    state = _grid_state(tuple(sorted(filters.items())))
+
+    if not from_db:
+        return products[:state["limit"]], len(products) > state["limit"]
+
+    column, _ = SORTS[filters.get("sort") or "Featured"]
+    while len(state["rows"]) < state["limit"] and not state["done"]:
+        page = build_product_query(supabase, filters, state["cursor"]).execute().data
+        state["rows"].extend(page)
+        if page:
+            state["cursor"] = (page[-1].get(column), page[-1]["id"])
+        if len(page) < PAGE_SIZE:
+            state["done"] = True
+    return state["rows"][:state["limit"]], not state["done"] or len(state["rows"]) > state["limit"]
+
+
+def load_more():
+    st.session_state["grid"]["limit"] += PAGE_SIZE
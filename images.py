@@ -0,0 +1,119 @@
+# images.py
+import hashlib
+import io
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import streamlit as st
+from PIL import Image, ImageDraw
+
+from supabase_config import get_http_pool
+
+CACHE_DIR = Path(st.secrets.get("IMAGE_CACHE_DIR", ".cache/images"))
+CACHE_MAX_BYTES = int(st.secrets.get("IMAGE_CACHE_MAX_MB", 200)) * 1024 * 1024
+BAD_URL_RETRY_SECONDS = 3600
+
+# Variant -> max (width, height); images keep their aspect ratio
+VARIANTS = {
+    "grid": (600, 400),
+    "thumb": (160, 160),
+}
+
+_lock = threading.Lock()
+_bad_urls = {}  # url -> time it last failed
+_cache_bytes = None
+
+
+def _path(url, variant):
+    digest = hashlib.sha1(f"{variant}:{url}".encode()).hexdigest()
+    return CACHE_DIR / f"{digest}.webp"
+
+
+def placeholder(variant):
+    """Locally generated 'Image Unavailable' tile — no network needed."""
+    path = CACHE_DIR / f"placeholder-{variant}.webp"
+    if not path.exists():
+        CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        width, height = VARIANTS[variant]
+        img = Image.new("RGB", (width, height), (60, 60, 60))
+        ImageDraw.Draw(img).text((10, height // 2), "Image Unavailable", fill=(200, 200, 200))
+        img.save(path, "WEBP")
+    return str(path)
+
+
+def _evict_if_needed(added, keep):
+    """Keep the cache under CACHE_MAX_BYTES by deleting least recently used files."""
+    global _cache_bytes
+    with _lock:
+        if _cache_bytes is None:
+            _cache_bytes = sum(f.stat().st_size for f in CACHE_DIR.glob("*.webp"))
+        else:
+            _cache_bytes += added
+        if _cache_bytes <= CACHE_MAX_BYTES:
+            return
+
+        files = sorted(
+            (f for f in CACHE_DIR.glob("*.webp") if f != keep and not f.name.startswith("placeholder-")),
+            key=lambda f: f.stat().st_mtime,
+        )
+        for f in files:
+            if _cache_bytes <= CACHE_MAX_BYTES * 0.9:
+                break
+            try:
+                size = f.stat().st_size
+                f.unlink()
+                _cache_bytes -= size
+            except FileNotFoundError:
+                pass
+
+
+def image_for(url, variant="grid"):
+    """Return a local path to a resized WebP of ``url``, or the placeholder.
+
+    Variants are cached on disk and touched on every hit, so eviction drops
+    the least recently shown images first. URLs that failed recently go
+    straight to the placeholder.
+    """
+    if not url:
+        return placeholder(variant)
+
+    path = _path(url, variant)
+    if path.exists():
+        os.utime(path)
+        return str(path)
+
+    failed_at = _bad_urls.get(url)
+    if failed_at and time.time() - failed_at < BAD_URL_RETRY_SECONDS:
+        return placeholder(variant)
+
+    try:
+        res = get_http_pool().get(url, follow_redirects=True)
+        res.raise_for_status()
+        img = Image.open(io.BytesIO(res.content))
+        img.thumbnail(VARIANTS[variant])
+        if img.mode not in ("RGB", "RGBA"):
+            img = img.convert("RGBA")
+
+        CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(f".{threading.get_ident()}.tmp")
+        img.save(tmp, "WEBP", quality=80)
+        os.replace(tmp, path)
+    except Exception:
+        _bad_urls[url] = time.time()
+        return placeholder(variant)
+
+    _evict_if_needed(path.stat().st_size, keep=path)
+    return str(path)
+
+
+@st.cache_resource
+def _download_pool():
+    return ThreadPoolExecutor(max_workers=8, thread_name_prefix="images")
+
+
+def images_for(urls, variant="grid"):
+    """image_for over many URLs, downloading cache misses in parallel."""
+    return list(_download_pool().map(lambda u: image_for(u, variant), urls))
@@ -1,15 +1,23 @@
 import streamlit as st
-from supabase_config import init_supabase
-from auth_helpers import signup, login, logout, get_current_user
-from checkout import show_checkout
+from supabase_config import get_supabase
+from auth_helpers import signup, login, logout, get_current_user, get_profile
+from checkout import checkout_pending, show_checkout
+from cart import init_cart, cart_changed, flush_cart, merge_anonymous_cart
+from catalog import load_catalog
+from catalog_feed import start_catalog_feed
+from search import search_products
+from grid import GRID_BACKEND, SORTS, apply_filters, visible_products, load_more
+from images import image_for, images_for, placeholder
+from tracing import TRACING, start_rerun, end_rerun, traced_rerun
 from pathlib import Path
 
 
 
-# Connect to Supabase
-supabase = init_supabase()
+# Connect to Supabase (shared client for public reads)
+supabase = get_supabase()
 
 st.set_page_config(page_title="My E-Commerce Concept")
+start_rerun("main")  # 📈 closed by end_rerun() wherever the script finishes
 
 
 # --- Custom Background ---
@@ -99,8 +107,38 @@ st.markdown('<a name="top"></a>', unsafe_allow_html=True)
 
 user = get_current_user()
 
-from datetime import datetime, timezone
-import time
+def show_welcome(user):
+    """Greet the user from the session's cached profile (no blocking round-trips)."""
+    try:
+        profile, loading = get_profile(user)
+    except Exception as e:
+        st.session_state.pop("_profile_polling", None)  # the next rerun starts a new fetch
+        st.error(f"⚠️ Unable to fetch or update profile: {e}")
+        st.success(f"Welcome back, {user.email} 👋")
+        return
+
+    if loading:
+        st.info("⏳ Loading your profile…")
+        return
+
+    if st.session_state.get("_profile_polling"):
+        # Fetch finished inside the polling fragment — refresh the whole page once
+        st.session_state.pop("_profile_polling")
+        st.rerun()
+
+    if not profile:
+        st.info("⏳ Your profile isn’t ready yet — try refreshing in a few seconds.")
+        st.success(f"🎉 Welcome, {user.user_metadata.get('full_name', user.email.split('@')[0])}!")
+        return
+
+    full_name = profile.get("full_name") or user.email.split("@")[0]
+    last_login = profile.get("last_login")
+
+    if not last_login:
+        st.success(f"🎉 Welcome, {full_name}! Glad to have you here for the first time.")
+    else:
+        st.success(f"👋 Welcome back, {full_name}!")
+
 
 with st.sidebar:
     st.markdown("## 🔐 Account")
@@ -114,6 +152,7 @@ with st.sidebar:
                 if res.get("error"):
                     st.error(res["error"])
                 else:
+                    merge_anonymous_cart(res["user"])  # 🛒 keep what they added before logging in
                     st.success("✅ Logged in successfully!")
                     st.rerun()
 
@@ -129,64 +168,48 @@ with st.sidebar:
                     st.success("🎉 Account created! Please check your email to verify.")
 
     else:
-        try:
-            # ✅ Try up to 3 times to get profile (trigger delay safe)
-            profile = None
-            for attempt in range(3):
-                res = supabase.table("users").select("*").eq("id", user.id).execute()
-                if res.data:
-                    profile = res.data[0]
-                    break
-                time.sleep(1.5)
-
-            if not profile:
-                st.info("⏳ Your profile isn’t ready yet — try refreshing in a few seconds.")
-                st.success(f"🎉 Welcome, {user.user_metadata.get('full_name', user.email.split('@')[0])}!")
-            else:
-                full_name = profile.get("full_name") or user.email.split("@")[0]
-                last_login = profile.get("last_login")
-
-                if not last_login:
-                    st.success(f"🎉 Welcome, {full_name}! Glad to have you here for the first time.")
-                else:
-                    st.success(f"👋 Welcome back, {full_name}!")
-
-                # ✅ Update last_login
-                now = datetime.now(timezone.utc).isoformat()
-                supabase.table("users").update({"last_login": now}).eq("id", user.id).execute()
-
-        except Exception as e:
-            st.error(f"⚠️ Unable to fetch or update profile: {e}")
-            st.success(f"Welcome back, {user.email} 👋")
+        if "profile" in st.session_state and st.session_state["profile"]["future"].done():
+            show_welcome(user)
+        else:
+            # ⏳ Poll just this block until the background profile fetch lands
+            st.session_state["_profile_polling"] = True
+            st.fragment(run_every="1s")(show_welcome)(user)
 
         if st.button("Logout"):
+            flush_cart()  # 🛒 save pending edits while the session is still signed in
             logout()
             st.rerun()
 
 
-page = st.sidebar.selectbox("Navigate", ["Shop", "Analytics","About"])
+page = st.sidebar.selectbox("Navigate", ["Shop", "Analytics","About"] + (["Tracing"] if TRACING else []))
 
 if page == "Analytics":
     from analytics import show_analytics
     show_analytics()
+    end_rerun()
     st.stop()
 
 if page == "About":
     from about import show_about
     show_about()
+    end_rerun()
     st.stop()
 
+if page == "Tracing":
+    from tracing import show_tracing
+    show_tracing()
+    end_rerun()
+    st.stop()
 
 
 
 
-# Fetch categories
-categories_response = supabase.table("categories").select("*").execute()
-categories = categories_response.data
 
-# Fetch products
-products_response = supabase.table("products").select("*").execute()
-products = products_response.data
+# Fetch categories + products (shared, TTL-bounded cache kept fresh by the change feed)
+start_catalog_feed(supabase)
+catalog = load_catalog(supabase)
+categories = catalog.categories
+products = catalog.products
 
 
 # Sidebar filter
@@ -195,55 +218,131 @@ selected_category = st.sidebar.selectbox("🗂️ Filter by Category", category_
 
 query = st.sidebar.text_input("🔍 Search products")
 
+sort = st.sidebar.selectbox("↕️ Sort by", list(SORTS))
+
+low, high = catalog.price_range
+price_range = (low, high)
+if low < high:
+    price_range = st.sidebar.slider(
+        "💰 Price range (₵)", float(low), float(high), (float(low), float(high))
+    )
+
 
 
 # -----------------------------------------
 # 🛒 PRODUCT FILTERING + CART + SIDEBAR VIEW
 # -----------------------------------------
 
-# Keep a master copy of all products before filtering
-if "products_all" not in st.session_state:
-    st.session_state.products_all = products.copy()
-
 # --- Filter Products Based on Category ---
-if selected_category != "All":
-    selected_cat = next((c for c in categories if c["name"] == selected_category), None)
-    if selected_cat:
-        products = [p for p in products if p.get("category_id") == selected_cat["id"]]
-
-# --- Filter by search query ---
-if query:
-    q = query.lower()
-    products = [
-        p for p in products
-        if q in (p.get("name", "").lower() + p.get("description", "").lower())
-    ]
-
-# --- Initialize cart in session_state ---
-if "cart" not in st.session_state:
-    st.session_state.cart = {}  # {product_id: quantity}
-
-# --- SIDEBAR CART HEADER ---
-total_quantity = sum(st.session_state.cart.values())
-st.sidebar.markdown(f"### 🛒 Cart: {total_quantity} item(s)")
-
-# --- DISPLAY PRODUCTS ---
-num_products = len(products)
-st.markdown(f"### {selected_category} ({num_products} Found)")
-
-if not products:
-    st.warning("No products found.")
-else:
+selected_cat = catalog.category_by_name.get(selected_category) if selected_category != "All" else None
+if selected_cat:
+    products = catalog.in_category(selected_cat["id"])
+
+# --- Filter by search query (precomputed index, ranked) ---
+search_truncated = False  # Postgres search returns only the best SEARCH_LIMIT matches
+if query and GRID_BACKEND != "postgres":
+    products, search_truncated = search_products(
+        supabase, catalog, query, selected_cat["id"] if selected_cat else None
+    )
+
+# --- Initialize cart in session_state (restored from the server once per session) ---
+init_cart(user)  # {product_id: quantity}
+
+
+def add_to_cart(pid):
+    st.session_state.cart[pid] = st.session_state.cart.get(pid, 0) + 1
+    cart_changed()
+    st.rerun("cart")  # 🔁 only the sidebar cart reruns, not the whole page
+
+
+# --- Price range + sort ---
+filters = {
+    "category_id": selected_cat["id"] if selected_cat else None,
+    "search": query or None,
+    "min_price": price_range[0] if price_range[0] > low else None,
+    "max_price": price_range[1] if price_range[1] < high else None,
+    "sort": sort,
+}
+from_db = GRID_BACKEND == "postgres"
+if not from_db:
+    products = apply_filters(products, filters)
+
+
+# --- SIDEBAR CART VIEW (reruns on its own) ---
+@st.fragment(key="cart")
+@traced_rerun("fragment:cart")
+def cart_panel(catalog):
+    total_quantity = sum(st.session_state.cart.values())
+    st.markdown(f"### 🛒 Cart: {total_quantity} item(s)")
+
+    with st.expander("🛍️ View Cart", expanded=False):
+        if st.session_state.cart:
+            cart_summary(catalog, total_quantity)
+        else:
+            st.info("Your cart is empty.")
+
+    # 📨 Also with an empty cart: an order placed before it was emptied still settles here
+    if st.session_state.cart or checkout_pending():
+        show_checkout(st.session_state.cart, catalog)
+
+
+def cart_summary(catalog, total_quantity):
+    """Line items of the (non-empty) cart, inside the cart expander."""
+    st.markdown("#### 🧾 Cart Summary")
+
+    for pid, qty in st.session_state.cart.items():
+        # ✅ Lookup product in the shared catalog index (not filtered list)
+        product = catalog.get(pid)
+
+        if product:
+            name = product.get("name", "Unnamed")
+            price = product.get("price", 0)
+            cols = st.columns([1, 2])
+            with cols[0]:
+                st.image(image_for(product.get("image_url"), "thumb"), width="stretch")
+            with cols[1]:
+                st.markdown(f"**{name}**")
+                st.write(f"Qty: {qty}")
+                st.write(f"₵ {price:,.2f}")
+        else:
+            st.write(f"Product ID: {pid} — Quantity: {qty}")
+
+    st.divider()
+    st.markdown(f"**🧮 Total Items:** {total_quantity}")
+
+    if st.button("🗑️ Clear Cart"):
+        st.session_state.cart.clear()
+        cart_changed()
+        st.rerun(scope="fragment")
+
+
+# --- DISPLAY PRODUCTS (one page at a time, reruns on its own) ---
+@st.fragment(key="grid")
+@traced_rerun("fragment:grid")
+def product_grid(products, filters, from_db):
+    page_products, has_more = visible_products(supabase, products, filters, from_db=from_db)
+
+    if from_db:
+        st.markdown(f"### {selected_category} ({len(page_products)}{'+' if has_more else ''} Shown)")
+    else:
+        st.markdown(f"### {selected_category} ({len(products)}{'+' if search_truncated else ''} Found)")
+        if search_truncated:
+            st.caption("Showing the best matches only — refine your search to narrow them down.")
+
+    if not page_products:
+        st.warning("No products found.")
+        return
+
     cols = st.columns(3)
-    fallback_img = "https://via.placeholder.com/300x200.png?text=Image+Unavailable"
+    # 🖼️ Resized, disk-cached variants (misses download in parallel)
+    grid_images = images_for([p.get("image_url") for p in page_products], "grid")
 
-    for i, product in enumerate(products):
+    for i, product in enumerate(page_products):
         with cols[i % 3]:
-            img_url = product.get("image_url", "")
             try:
-                st.image(img_url or fallback_img, use_container_width=True)
+                st.image(grid_images[i], width="stretch")
             except Exception:
-                st.image(fallback_img, use_container_width=True)
+                st.image(placeholder("grid"), width="stretch")
 
             st.subheader(product.get("name", "Unnamed"))
             description = product.get("description", "").strip()
@@ -259,48 +358,16 @@ else:
 
             # --- ADD TO CART BUTTON ---
             pid = str(product["id"])
-            if st.button(f"Add to Cart 🛒", key=f"add-{pid}-{i}"):
-                st.session_state.cart[pid] = st.session_state.cart.get(pid, 0) + 1
-                st.rerun()  # 🔁 rerun to immediately refresh sidebar count
-
-# --- SIDEBAR CART VIEW ---
-with st.sidebar.expander("🛍️ View Cart", expanded=False):
-    if not st.session_state.cart:
-        st.info("Your cart is empty.")
-    else:
-        st.markdown("#### 🧾 Cart Summary")
-
-        for pid, qty in st.session_state.cart.items():
-            # ✅ Lookup product in the master list (not filtered list)
-            product = next(
-                (p for p in st.session_state.products_all if str(p.get("id")) == pid),
-                None
-            )
-
-            if product:
-                name = product.get("name", "Unnamed")
-                price = product.get("price", 0)
-                img_url = product.get("image_url", "https://via.placeholder.com/80x80.png?text=No+Image")
-
-                cols = st.columns([1, 2])
-                with cols[0]:
-                    st.image(img_url, use_container_width=True)
-                with cols[1]:
-                    st.markdown(f"**{name}**")
-                    st.write(f"Qty: {qty}")
-                    st.write(f"₵ {price:,.2f}")
-            else:
-                st.write(f"Product ID: {pid} — Quantity: {qty}")
-
-        st.divider()
-        st.markdown(f"**🧮 Total Items:** {total_quantity}")
-
-        if st.button("🗑️ Clear Cart"):
-            st.session_state.cart.clear()
-            st.rerun()
+            st.button(f"Add to Cart 🛒", key=f"add-{pid}-{i}", on_click=add_to_cart, args=(pid,))
 
+    if has_more:
+        st.button("⬇️ Load more", on_click=load_more, width="stretch")
 
-        show_checkout(st.session_state.cart, st.session_state.products_all)
+
+with st.sidebar:
+    cart_panel(catalog)
+
+product_grid(products, filters, from_db)
 
 
 
@@ -398,6 +465,8 @@ st.markdown("""
     </div>
 """, unsafe_allow_html=True)
 
+end_rerun()
+
 
 
 
@@ -0,0 +1,599 @@
+# memory_backend.py
+"""In-memory stand-in for Supabase, for offline runs, profiling and benchmarks.
+
+Implements the part of the supabase-py client the app uses:
+
+- ``table(name)`` with ``select``, ``insert``, ``update``, ``upsert`` and
+  ``delete``; the filters ``eq``, ``neq``, ``gt``, ``gte``, ``lt``, ``lte``,
+  ``in_``, ``is_``, ``filter``, ``or_`` and ``text_search``; ``order``,
+  ``limit`` and ``range``
+- ``rpc(name, params)`` for the functions in ``sql/``, with ``select``,
+  ``limit`` and ``range`` on set-returning ones
+- ``auth`` sign-up, password sign-in, refresh and sign-out
+
+Every request sleeps ``latency_ms`` first, so round-trip-bound code paths
+cost roughly what they would against a remote project, deterministically.
+Select it with ``SUPABASE_BACKEND = "memory"`` (see supabase_config.py).
+"""
+import random
+import re
+import threading
+import time
+import types
+import uuid
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+
+import jwt
+from postgrest.exceptions import APIError
+from supabase_auth.errors import AuthApiError
+
+from pricing import PricingRule, apply_rules
+
+# Tokens are HS256; auth_helpers verifies them offline unless SUPABASE_JWT_SECRET is set
+JWT_SECRET = "memory-backend-signing-key-not-secret"
+
+WORDS = ["classic", "linen", "leather", "denim", "wool", "summer", "silk", "cotton",
+         "canvas", "vintage", "slim", "oversized", "suede", "knit", "cropped", "relaxed"]
+ITEMS = ["shirt", "jacket", "dress", "sneakers", "boots", "hat", "scarf", "bag",
+         "jeans", "skirt", "belt", "hoodie", "sandals", "blazer", "watch", "socks"]
+STATUSES = ["pending", "paid", "shipped", "completed", "cancelled"]
+
+
+def _now():
+    return datetime.now(timezone.utc).isoformat()
+
+
+# --- Seed data ---
+
+def seed_data(products=200, categories=8, orders=1000, seed=0):
+    """Tables the app reads, filled with deterministic sample rows."""
+    rng = random.Random(seed)
+    now = datetime.now(timezone.utc)
+    tables = {
+        "categories": [{"id": i, "name": f"Category {i}"} for i in range(1, categories + 1)],
+        "products": [],
+        "orders": [],
+        "order_items": [],
+        "payment": [],
+        "users": [],
+        "pricing_rules": [],
+    }
+    for pid in range(1, products + 1):
+        tables["products"].append({
+            "id": pid,
+            "name": f"{rng.choice(WORDS).title()} {rng.choice(ITEMS)} {pid}",
+            "description": " ".join(rng.choices(WORDS + ITEMS, k=12)),
+            "price": round(rng.uniform(5, 500), 2),
+            "image_url": "",
+            "attribution": None,
+            "category_id": rng.randint(1, categories) if categories else None,
+        })
+    # About four orders per customer, so the cohorts have repeat buyers
+    customers = [str(uuid.UUID(int=rng.getrandbits(128), version=4)) for _ in range(max(1, orders // 4))]
+    created = sorted(now - timedelta(minutes=rng.randint(0, 365 * 24 * 60)) for _ in range(orders))
+    for created_at in created:
+        add_random_order(tables, rng, created_at, rng.choice(customers))
+    return tables
+
+
+def add_random_order(tables, rng, created_at=None, user_id=None):
+    """Append an order with 1-4 random items and its payment."""
+    created_at = (created_at or datetime.now(timezone.utc)).isoformat()
+    oid = len(tables["orders"]) + 1
+    total = 0.0
+    for _ in range(rng.randint(1, 4)):
+        product = rng.choice(tables["products"])
+        qty = rng.randint(1, 3)
+        total += product["price"] * qty
+        tables["order_items"].append({
+            "id": len(tables["order_items"]) + 1, "order_id": oid, "product_id": product["id"],
+            "quantity": qty, "price": product["price"], "subtotal": product["price"] * qty,
+        })
+    tables["orders"].append({
+        "id": oid, "user_id": user_id, "created_at": created_at,
+        "total": round(total, 2), "status": rng.choice(STATUSES),
+    })
+    tables["payment"].append({
+        "id": len(tables["payment"]) + 1, "order_id": oid,
+        "amount": round(total, 2), "created_at": created_at,
+    })
+    return oid
+
+
+# --- Filters ---
+
+def _coerce(raw, sample):
+    """Turn a PostgREST filter string into the type of the column's values."""
+    if raw == "null":
+        return None
+    if isinstance(sample, bool):
+        return raw == "true"
+    if isinstance(sample, (int, float)):
+        return float(raw)
+    return raw
+
+
+def _compare(op, value, target):
+    if op == "eq":
+        return value == target
+    if op == "neq":
+        return value != target
+    if op == "is":
+        return value is target if target is None else value == target
+    if value is None or target is None:
+        return False
+    return {"gt": value > target, "gte": value >= target,
+            "lt": value < target, "lte": value <= target}[op]
+
+
+def _split_top_level(text):
+    """Split ``a,and(b,c),d`` on commas outside parentheses and quotes."""
+    parts, depth, quoted, current = [], 0, False, ""
+    for i, ch in enumerate(text):
+        if ch == '"' and text[i - 1:i] != "\\":
+            quoted = not quoted
+        elif not quoted and ch == "(":
+            depth += 1
+        elif not quoted and ch == ")":
+            depth -= 1
+        elif not quoted and ch == "," and depth == 0:
+            parts.append(current)
+            current = ""
+            continue
+        current += ch
+    parts.append(current)
+    return parts
+
+
+def _logic_filter(expression, combine=any):
+    """Row test for a PostgREST logic tree such as ``price.gt.5,and(price.eq.5,id.gt.3)``."""
+    tests = []
+    for term in _split_top_level(expression):
+        match = re.fullmatch(r"(and|or)\((.*)\)", term)
+        if match:
+            tests.append(_logic_filter(match.group(2), all if match.group(1) == "and" else any))
+            continue
+        column, op, raw = term.split(".", 2)
+        if raw.startswith('"'):
+            raw = raw[1:-1].replace('\\"', '"').replace("\\\\", "\\")
+        tests.append(lambda r, c=column, o=op, v=raw: _compare(o, r.get(c), _coerce(v, r.get(c))))
+    return lambda row: combine(test(row) for test in tests)
+
+
+def _words(text):
+    return set(re.findall(r"\w+", (text or "").lower()))
+
+
+# --- Client ---
+
+class MemoryQuery:
+    """A PostgREST-style request against one in-memory table."""
+
+    def __init__(self, client, table):
+        self._client = client
+        self._table = table
+        self._action = "select"
+        self._payload = None
+        self._on_conflict = "id"
+        self._columns = None
+        self._filters = []
+        self._orders = []
+        self._range = None
+
+    # Actions
+    def select(self, columns="*", **kwargs):
+        self._columns = None if columns.strip() == "*" else [c.strip() for c in columns.split(",")]
+        return self
+
+    def insert(self, rows, **kwargs):
+        self._action, self._payload = "insert", rows
+        return self
+
+    def upsert(self, rows, on_conflict="id", **kwargs):
+        self._action, self._payload, self._on_conflict = "upsert", rows, on_conflict
+        return self
+
+    def update(self, values, **kwargs):
+        self._action, self._payload = "update", values
+        return self
+
+    def delete(self, **kwargs):
+        self._action = "delete"
+        return self
+
+    # Filters
+    def _where(self, test):
+        self._filters.append(test)
+        return self
+
+    def filter(self, column, op, value):
+        return self._where(lambda r: _compare(op, r.get(column), value))
+
+    def eq(self, column, value):
+        return self.filter(column, "eq", value)
+
+    def neq(self, column, value):
+        return self.filter(column, "neq", value)
+
+    def gt(self, column, value):
+        return self.filter(column, "gt", value)
+
+    def gte(self, column, value):
+        return self.filter(column, "gte", value)
+
+    def lt(self, column, value):
+        return self.filter(column, "lt", value)
+
+    def lte(self, column, value):
+        return self.filter(column, "lte", value)
+
+    def in_(self, column, values):
+        values = set(values)
+        return self._where(lambda r: r.get(column) in values)
+
+    def is_(self, column, value):
+        target = None if value in (None, "null") else value
+        return self._where(lambda r: r.get(column) is target)
+
+    def or_(self, filters, **kwargs):
+        return self._where(_logic_filter(filters))
+
+    def text_search(self, column, query, options=None):
+        """Every word of ``query`` must appear in the name or description (``fts``)."""
+        wanted = _words(query)
+
+        def test(row):
+            if column == "fts":
+                text = f"{row.get('name') or ''} {row.get('description') or ''}"
+            else:
+                text = row.get(column)
+            return wanted <= _words(text)
+        return self._where(test)
+
+    # Modifiers
+    def order(self, column, desc=False, **kwargs):
+        self._orders.append((column, desc))
+        return self
+
+    def limit(self, count, **kwargs):
+        self._range = (0, count - 1)
+        return self
+
+    def range(self, start, end, **kwargs):
+        self._range = (start, end)
+        return self
+
+    def execute(self):
+        store = self._client.store
+        store.round_trip()
+        with store.lock:
+            rows = store.tables.setdefault(self._table, [])
+            if self._action == "select":
+                data = self._select(rows)
+            elif self._action == "delete":
+                data = [r for r in rows if self._matches(r)]
+                rows[:] = [r for r in rows if not self._matches(r)]
+            elif self._action == "update":
+                data = [r for r in rows if self._matches(r)]
+                for r in data:
+                    r.update(self._payload)
+            else:
+                data = self._write(rows)
+        return types.SimpleNamespace(data=[dict(r) for r in data], count=None)
+
+    def _matches(self, row):
+        return all(test(row) for test in self._filters)
+
+    def _select(self, rows):
+        rows = [r for r in rows if self._matches(r)]
+        for column, desc in reversed(self._orders):
+            # Stable sorts, last key first; nulls go last like the app asks for
+            present = [r for r in rows if r.get(column) is not None]
+            missing = [r for r in rows if r.get(column) is None]
+            rows = sorted(present, key=lambda r: r[column], reverse=desc) + missing
+        if self._range:
+            rows = rows[self._range[0]:self._range[1] + 1]
+        if self._columns:
+            rows = [{c: r.get(c) for c in self._columns} for r in rows]
+        return rows
+
+    def _write(self, rows):
+        new_rows = self._payload if isinstance(self._payload, list) else [self._payload]
+        keys = [k.strip() for k in self._on_conflict.split(",")]
+        written = []
+        for new in new_rows:
+            new = dict(new)
+            existing = None
+            if all(k in new for k in keys):
+                existing = next((r for r in rows if all(r.get(k) == new[k] for k in keys)), None)
+            if existing is not None:
+                if self._action == "insert":
+                    raise APIError({"message": "duplicate key value violates unique constraint",
+                                    "code": "23505"})
+                existing.update(new)
+                written.append(existing)
+                continue
+            if "id" not in new:
+                new["id"] = max((r.get("id") or 0 for r in rows), default=0) + 1
+            rows.append(new)
+            written.append(new)
+        return written
+
+
+class MemoryAuth:
+    """Password auth against the store's user list; one signed-in user per client."""
+
+    def __init__(self, client):
+        self._client = client
+        self.user = None
+
+    def _session(self):
+        expires_at = int(time.time()) + 3600
+        token = jwt.encode({"sub": self.user.id, "email": self.user.email, "exp": expires_at,
+                            "aud": "authenticated"}, JWT_SECRET, algorithm="HS256")
+        return types.SimpleNamespace(access_token=token, refresh_token=str(uuid.uuid4()),
+                                     expires_at=expires_at, user=self.user)
+
+    def sign_up(self, credentials):
+        store = self._client.store
+        store.round_trip()
+        options = credentials.get("options") or {}
+        user = store.add_user(credentials["email"], credentials["password"], options.get("data"))
+        return types.SimpleNamespace(user=user, session=None)
+
+    def sign_in_with_password(self, credentials):
+        store = self._client.store
+        store.round_trip()
+        account = store.auth_users.get(credentials["email"])
+        if not account or account["password"] != credentials["password"]:
+            raise AuthApiError("Invalid login credentials", 400, "invalid_credentials")
+        self.user = account["user"]
+        return types.SimpleNamespace(user=self.user, session=self._session())
+
+    def refresh_session(self, refresh_token=None):
+        self._client.store.round_trip()
+        if not self.user:
+            raise AuthApiError("Invalid Refresh Token", 400, "refresh_token_not_found")
+        return types.SimpleNamespace(user=self.user, session=self._session())
+
+    def get_session(self):
+        return self._session() if self.user else None
+
+    def sign_out(self, options=None):
+        self._client.store.round_trip()
+        self.user = None
+
+
+class MemoryRpc:
+    def __init__(self, client, name, params):
+        self._client, self._name, self._params = client, name, params or {}
+        self._columns = None
+        self._range = None
+
+    def select(self, columns="*", **kwargs):
+        self._columns = None if columns.strip() == "*" else [c.strip() for c in columns.split(",")]
+        return self
+
+    def limit(self, count, **kwargs):
+        self._range = (0, count - 1)
+        return self
+
+    def range(self, start, end, **kwargs):
+        self._range = (start, end)
+        return self
+
+    def execute(self):
+        self._client.store.round_trip()
+        handler = getattr(self._client, f"_rpc_{self._name}", None)
+        if handler is None:
+            raise APIError({"message": f"Could not find the function public.{self._name}",
+                            "code": "PGRST202"})
+        with self._client.store.lock:
+            data = handler(**self._params)
+        if isinstance(data, list):
+            if self._range:
+                data = data[self._range[0]:self._range[1] + 1]
+            if self._columns:
+                data = [{c: r.get(c) for c in self._columns} for r in data]
+        return types.SimpleNamespace(data=data)
+
+
+class MemoryClient:
+    """Drop-in for ``supabase.Client``; every client shares its store's tables."""
+
+    def __init__(self, store):
+        self.store = store
+        self.auth = MemoryAuth(self)
+
+    def table(self, name):
+        return MemoryQuery(self, name)
+
+    from_ = table
+
+    def rpc(self, name, params=None):
+        return MemoryRpc(self, name, params)
+
+    # --- sql/ functions, called with the store locked ---
+
+    def _uid(self):
+        return self.auth.user.id if self.auth.user else None
+
+    def _cart_owner(self, token):
+        if self._uid():
+            return f"user:{self._uid()}"
+        if not token or len(token) < 32:
+            raise APIError({"message": "A cart token is required for anonymous carts", "code": "P0001"})
+        return f"anon:{token}"
+
+    def _rpc_login_profile(self):
+        users = self.store.tables["users"]
+        row = next((u for u in users if u["id"] == self._uid()), None)
+        if row is None:
+            row = {"id": self._uid(), "email": self.auth.user.email, "last_login": None,
+                   "full_name": (self.auth.user.user_metadata or {}).get("full_name")}
+            users.append(row)
+        prior = dict(row)
+        row["last_login"] = _now()
+        return prior
+
+    def _rpc_load_cart(self, p_anon_token=None):
+        return dict(self.store.carts.get(self._cart_owner(p_anon_token), {}))
+
+    def _rpc_save_cart(self, p_items, p_anon_token=None):
+        self.store.carts[self._cart_owner(p_anon_token)] = dict(p_items)
+
+    def _rpc_merge_cart(self, p_anon_token):
+        if not self._uid():
+            raise APIError({"message": "You must be logged in to merge a cart", "code": "P0001"})
+        owner = self._cart_owner(None)
+        merged = Counter(self.store.carts.get(owner, {}))
+        merged.update(self.store.carts.pop(f"anon:{p_anon_token}", {}))
+        self.store.carts[owner] = dict(merged)
+        return dict(merged)
+
+    def _rpc_price_items(self, p_items):
+        tables = self.store.tables
+        products = {str(p["id"]): p for p in tables["products"]}
+        lines = [(products[str(i["product_id"])], i["quantity"]) for i in p_items
+                 if str(i["product_id"]) in products and i["quantity"] > 0]
+        subtotal = sum(Decimal(str(p.get("price") or 0)) * q for p, q in lines)
+        by_category = defaultdict(Decimal)
+        for p, q in lines:
+            by_category[str(p.get("category_id"))] += Decimal(str(p.get("price") or 0)) * q
+        rules = sorted((r for r in tables["pricing_rules"] if r.get("active", True)),
+                       key=lambda r: (r.get("position", 0), r.get("id", 0)))
+        adjustments, total = apply_rules(subtotal, by_category, [PricingRule.from_row(r) for r in rules])
+        return {"subtotal": float(subtotal), "total": total,
+                "adjustments": [{"label": label, "amount": amount} for label, amount in adjustments]}
+
+    def _rpc_place_order(self, p_idempotency_key, p_items, p_payment_method, p_expected_total=None):
+        if not self._uid():
+            raise APIError({"message": "You must be logged in to place an order", "code": "P0001"})
+        key = (self._uid(), p_idempotency_key)
+        if key in self.store.order_keys:
+            return {"order_id": self.store.order_keys[key], "duplicate": True}
+
+        tables = self.store.tables
+        products = {str(p["id"]): p for p in tables["products"]}
+        # Like the SQL's join on products and "quantity > 0": other lines are ignored
+        lines = [(products[str(i["product_id"])], i) for i in p_items
+                 if str(i["product_id"]) in products and i["quantity"] > 0]
+        priced = self._rpc_price_items(p_items)
+        stale = any(
+            item.get("unit_price") is not None and item["unit_price"] != (p.get("price") or 0)
+            for p, item in lines
+        )
+        if stale or (p_expected_total is not None and priced["total"] != p_expected_total):
+            raise APIError({"message": "Prices changed", "hint": "prices_changed", "code": "P0001"})
+
+        oid = len(tables["orders"]) + 1
+        now = _now()
+        for product, item in lines:
+            price = product.get("price") or 0
+            tables["order_items"].append({
+                "id": len(tables["order_items"]) + 1, "order_id": oid,
+                "product_id": product["id"], "quantity": item["quantity"],
+                "price": price, "subtotal": price * item["quantity"],
+            })
+        tables["orders"].append({"id": oid, "user_id": self._uid(), "created_at": now,
+                                 "total": priced["total"], "status": "paid",
+                                 "idempotency_key": p_idempotency_key,
+                                 "adjustments": priced["adjustments"]})
+        tables["payment"].append({"id": len(tables["payment"]) + 1, "order_id": oid,
+                                  "amount": priced["total"], "created_at": now,
+                                  "payment_method": p_payment_method})
+        self.store.order_keys[key] = oid
+        return {"order_id": oid, "total": priced["total"], "duplicate": False}
+
+    def _rpc_search_products(self, p_query, p_category_id=None):
+        # Name words weigh more than description words, like setweight A/B
+        wanted = _words(p_query)
+        ranked = []
+        for p in self.store.tables["products"]:
+            if p_category_id is not None and str(p.get("category_id")) != str(p_category_id):
+                continue
+            name, description = _words(p.get("name")), _words(p.get("description"))
+            if wanted and wanted <= name | description:
+                ranked.append((-(len(wanted & name) * 3 + len(wanted & description)), p["id"], p))
+        return [dict(p) for _, _, p in sorted(ranked, key=lambda r: r[:2])]
+
+    def _rpc_dashboard_facts(self):
+        tables = self.store.tables
+        category = {p["id"]: p.get("category_id") for p in tables["products"]}
+        orders, items = defaultdict(lambda: [0, 0.0]), defaultdict(lambda: [0, 0.0])
+        paid, category_orders = Counter(), Counter()
+        day_status, first, active, counts = {}, {}, set(), Counter()
+        for o in tables["orders"]:
+            day, status = str(o.get("created_at") or "")[:10], o.get("status") or ""
+            day_status[o["id"]] = (day, status)
+            cell = orders[day, status]
+            cell[0] += 1
+            cell[1] += o.get("total") or 0
+            if o.get("user_id") and day:
+                first[o["user_id"]] = min(first.get(o["user_id"], day[:7]), day[:7])
+                active.add((o["user_id"], day[:7]))
+                counts[o["user_id"]] += 1
+        in_category = set()
+        for i in tables["order_items"]:
+            day, status = day_status[i["order_id"]]
+            cid = "" if category.get(i["product_id"]) is None else str(category[i["product_id"]])
+            cell = items[day, str(i["product_id"]), cid]
+            cell[0] += i.get("quantity") or 0
+            cell[1] += i.get("subtotal") or 0
+            if cid:
+                in_category.add((i["order_id"], cid))
+        for oid, cid in in_category:
+            day, status = day_status[oid]
+            category_orders[day, cid, status] += 1
+        for p in tables["payment"]:
+            paid[day_status[p["order_id"]][0]] += p.get("amount") or 0
+        cohorts = Counter((first[user], month) for user, month in active)
+        sizes = defaultdict(lambda: [0, 0])
+        for user, cohort in first.items():
+            sizes[cohort][0] += 1
+            sizes[cohort][1] += counts[user] >= 2
+        return {
+            "orders": [{"day": d, "status": s, "orders": n, "total": t} for (d, s), (n, t) in orders.items()],
+            "paid": [{"day": d, "paid": v} for d, v in paid.items()],
+            "items": [{"day": d, "product_id": p, "category_id": c, "units": u, "revenue": r}
+                      for (d, p, c), (u, r) in items.items()],
+            "category_orders": [{"day": d, "category_id": c, "status": s, "orders": n}
+                                for (d, c, s), n in category_orders.items()],
+            "cohorts": [{"cohort": c, "active": a, "customers": n} for (c, a), n in cohorts.items()],
+            "cohort_sizes": [{"cohort": c, "customers": n, "repeat_customers": r} for c, (n, r) in sizes.items()],
+        }
+
+
+class MemoryStore:
+    """Tables, auth users and the state behind the sql/ functions, shared by all clients."""
+
+    def __init__(self, tables=None, latency_ms=0.0):
+        self.tables = defaultdict(list, tables or {})
+        self.latency_ms = latency_ms
+        self.lock = threading.RLock()
+        self.auth_users = {}   # email -> {"password", "user"}
+        self.carts = {}        # owner -> {product_id: quantity}
+        self.order_keys = {}   # (user_id, idempotency key) -> order id
+        self.requests = 0
+        self._count_lock = threading.Lock()
+
+    def round_trip(self):
+        """Count one request and pay the configured latency for it."""
+        with self._count_lock:
+            self.requests += 1
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+
+    def add_user(self, email, password, metadata=None):
+        with self.lock:
+            if email in self.auth_users:
+                raise AuthApiError("User already registered", 422, "user_already_exists")
+            user = types.SimpleNamespace(id=str(uuid.uuid4()), email=email,
+                                         user_metadata=dict(metadata or {}))
+            self.auth_users[email] = {"password": password, "user": user}
+            return user
+
+    def client(self):
+        return MemoryClient(self)
@@ -0,0 +1,178 @@
+# order_queue.py
+"""Background order submission for checkout.
+
+"Confirm & Pay" queues a job and returns at once; a fixed pool of worker
+threads calls the place_order RPC (sql/place_order.sql) and the checkout
+polls the job's status. Transient failures are retried with exponential
+backoff — safe because every job carries the session's idempotency key —
+and jobs that run out of attempts are kept in a dead-letter list. The
+queue is bounded, so a checkout burst beyond its size is turned away
+instead of piling up threads.
+"""
+import queue
+import random
+import threading
+import time
+import uuid
+from collections import deque
+from dataclasses import dataclass, field
+
+import httpx
+import streamlit as st
+from postgrest.exceptions import APIError
+
+CHECKOUT_WORKERS = int(st.secrets.get("CHECKOUT_WORKERS", 4))
+CHECKOUT_QUEUE_SIZE = int(st.secrets.get("CHECKOUT_QUEUE_SIZE", 200))
+CHECKOUT_MAX_ATTEMPTS = int(st.secrets.get("CHECKOUT_MAX_ATTEMPTS", 4))
+CHECKOUT_BACKOFF_SECONDS = float(st.secrets.get("CHECKOUT_BACKOFF_SECONDS", 0.5))
+CHECKOUT_POLL_SECONDS = float(st.secrets.get("CHECKOUT_POLL_SECONDS", 1))
+
+# Finished jobs stay pollable this long, then are dropped
+JOB_TTL_SECONDS = 900
+
+# Database errors worth retrying: serialization failure, deadlock, statement
+# timeout and PostgREST's "could not connect" family. Anything else the
+# database said (e.g. 'Prices changed') would only be said again.
+RETRYABLE_CODES = {"40001", "40P01", "57014", "PGRST000", "PGRST001", "PGRST002", "PGRST003"}
+
+
+class QueueFull(Exception):
+    """The checkout queue is at capacity; ask the user to try again shortly."""
+
+
+@dataclass
+class OrderJob:
+    id: str
+    idempotency_key: str
+    params: dict
+    client: object = field(repr=False)
+    status: str = "queued"  # queued, processing, retrying, done, failed
+    attempts: int = 0
+    result: dict = None
+    error: str = None
+    created_at: float = field(default_factory=time.monotonic)
+    finished_at: float = None
+
+    @property
+    def finished(self):
+        return self.status in ("done", "failed")
+
+
+def is_retryable(error):
+    if isinstance(error, APIError):
+        return error.code in RETRYABLE_CODES
+    return isinstance(error, (httpx.TransportError, OSError))
+
+
+class OrderQueue:
+    """Bounded queue of place_order jobs drained by a fixed pool of threads."""
+
+    def __init__(self, workers, maxsize, max_attempts, backoff):
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self._queue = queue.Queue(maxsize)
+        self._jobs = {}  # id -> OrderJob
+        self._by_key = {}  # idempotency key -> id of its unfinished job
+        self._lock = threading.Lock()
+        self.dead_letters = deque(maxlen=100)
+        self.completed = 0
+        self.failed = 0
+        self.retries = 0
+        self.rejected = 0
+        for n in range(workers):
+            threading.Thread(target=self._work, daemon=True, name=f"order-worker-{n}").start()
+
+    def submit(self, client, params):
+        """Queue a place_order call made with ``client`` (the user's session client).
+
+        A job for the same idempotency key that is still running is returned
+        instead of queueing a second one. Raises :class:`QueueFull`.
+        """
+        key = params["p_idempotency_key"]
+        with self._lock:
+            self._prune()
+            running = self._jobs.get(self._by_key.get(key))
+            if running is not None and not running.finished:
+                return running
+            job = OrderJob(id=str(uuid.uuid4()), idempotency_key=key, params=dict(params), client=client)
+            try:
+                self._queue.put_nowait(job)
+            except queue.Full:
+                self.rejected += 1
+                raise QueueFull("Checkout is busy right now") from None
+            self._jobs[job.id] = job
+            self._by_key[key] = job.id
+        return job
+
+    def get(self, job_id):
+        """The job with this id, or None if it is unknown or expired."""
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "queued": self._queue.qsize(),
+                "in_flight": sum(1 for j in self._jobs.values() if not j.finished),
+                "completed": self.completed,
+                "failed": self.failed,
+                "retries": self.retries,
+                "rejected": self.rejected,
+                "dead_letters": len(self.dead_letters),
+            }
+
+    def _prune(self):
+        now = time.monotonic()
+        for job_id, job in list(self._jobs.items()):
+            if job.finished and now - job.finished_at > JOB_TTL_SECONDS:
+                del self._jobs[job_id]
+
+    def _finish(self, job, status, result=None, error=None):
+        with self._lock:
+            job.status, job.result, job.error = status, result, error
+            job.finished_at = time.monotonic()
+            if self._by_key.get(job.idempotency_key) == job.id:
+                del self._by_key[job.idempotency_key]
+            if status == "done":
+                self.completed += 1
+            else:
+                self.failed += 1
+
+    def _work(self):
+        while True:
+            job = self._queue.get()
+            try:
+                self._run(job)
+            except Exception as e:  # never lose a worker
+                self._finish(job, "failed", error=str(e))
+
+    def _run(self, job):
+        for attempt in range(1, self.max_attempts + 1):
+            job.attempts = attempt
+            job.status = "processing"
+            try:
+                result = job.client.rpc("place_order", job.params).execute().data
+            except Exception as e:
+                if not is_retryable(e):
+                    self._finish(job, "failed", error=str(e))
+                    return
+                if attempt == self.max_attempts:
+                    self._finish(job, "failed", error=str(e))
+                    self.dead_letters.append(job)
+                    return
+                # ⏳ Exponential backoff with jitter, so a burst of retries spreads out
+                job.status = "retrying"
+                with self._lock:
+                    self.retries += 1
+                time.sleep(self.backoff * 2 ** (attempt - 1) * random.uniform(0.5, 1.5))
+            else:
+                self._finish(job, "done", result=result)
+                return
+
+
+@st.cache_resource
+def get_order_queue() -> OrderQueue:
+    """Return the checkout queue shared by every session in this process."""
+    return OrderQueue(
+        CHECKOUT_WORKERS, CHECKOUT_QUEUE_SIZE, CHECKOUT_MAX_ATTEMPTS, CHECKOUT_BACKOFF_SECONDS
+    )
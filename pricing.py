@@ -0,0 +1,150 @@
+# pricing.py
+"""Cart pricing: one vectorized pass over the catalog's price column plus rules.
+
+Rules come from the ``pricing_rules`` table (sql/pricing.sql) and are loaded
+with the catalog, so a :class:`PriceSnapshot` is tied to one catalog
+version. The same arithmetic runs in ``price_items()`` on the server, and
+place_order rejects a snapshot whose prices or total no longer match.
+"""
+from dataclasses import dataclass
+from decimal import ROUND_HALF_UP, Decimal
+
+import numpy as np
+import streamlit as st
+
+RULE_KINDS = ("percent_off", "category_percent_off", "tax")
+CENT = Decimal("0.01")
+
+
+@dataclass(frozen=True)
+class PricingRule:
+    """One active row of pricing_rules, applied in ``position`` order."""
+    kind: str
+    percent: float
+    label: str = ""
+    min_subtotal: float = 0.0
+    category_id: str = None  # category_percent_off only
+
+    @classmethod
+    def from_row(cls, row) -> "PricingRule":
+        category_id = row.get("category_id")
+        return cls(
+            kind=row["kind"],
+            percent=float(row.get("percent") or 0),
+            label=row.get("label") or "",
+            min_subtotal=float(row.get("min_subtotal") or 0),
+            category_id=None if category_id is None else str(category_id),
+        )
+
+
+def _money(value) -> Decimal:
+    # Half away from zero, like Postgres round(numeric, 2)
+    return Decimal(str(value)).quantize(CENT, ROUND_HALF_UP)
+
+
+def apply_rules(subtotal, category_subtotals, rules):
+    """Return ``(adjustments, total)`` for a subtotal, as price_items() computes it.
+
+    ``category_subtotals`` maps ``str(category_id)`` to that category's share
+    of the subtotal. Each adjustment is ``(label, amount)``; discounts are
+    negative. Percent-off and tax apply to the running total.
+    """
+    subtotal = _money(subtotal)
+    running = subtotal
+    adjustments = []
+    for rule in rules:
+        if subtotal < _money(rule.min_subtotal):
+            continue
+        rate = Decimal(str(rule.percent)) / 100
+        if rule.kind == "percent_off":
+            amount = -_money(running * rate)
+        elif rule.kind == "category_percent_off":
+            amount = -_money(_money(category_subtotals.get(rule.category_id, 0)) * rate)
+        elif rule.kind == "tax":
+            amount = _money(running * rate)
+        else:
+            continue
+        if amount:
+            adjustments.append((rule.label or rule.kind, float(amount)))
+            running += amount
+    return adjustments, float(running)
+
+
+@dataclass(frozen=True)
+class PriceSnapshot:
+    """A priced cart, valid for one catalog version."""
+    catalog_version: int
+    lines: tuple        # (product_id, quantity, unit_price, line_total)
+    subtotal: float
+    adjustments: tuple  # (label, amount)
+    total: float
+    unavailable: tuple  # cart product ids missing from the catalog
+
+    def items(self):
+        """``p_items`` for place_order, carrying the prices the user saw."""
+        return [
+            {"product_id": pid, "quantity": qty, "unit_price": price}
+            for pid, qty, price, _ in self.lines
+        ]
+
+
+def _price(cart, catalog) -> PriceSnapshot:
+    columns = catalog.columns
+    ids = list(cart)
+    positions = np.array([
+        -1 if (i := columns.position(pid)) is None else i for pid in ids
+    ], dtype=np.int64)
+    found = positions >= 0
+    at = positions[found]
+    quantities = np.array([cart[pid] for pid in ids], dtype=np.int64)[found]
+
+    # Whole cents keep the sums exact
+    if "price" in columns.numeric:
+        cents = np.rint(np.nan_to_num(columns.numeric["price"][at]) * 100).astype(np.int64)
+    else:
+        cents = np.zeros(len(at), dtype=np.int64)
+    line_cents = cents * quantities
+
+    category_cents = {}
+    wanted = {r.category_id for r in catalog.pricing_rules if r.kind == "category_percent_off"}
+    if wanted:
+        # As text, like price_items()'s p.category_id::text = r.category_id (ids may be uuids)
+        categories = np.array(
+            ["" if (c := columns.value("category_id", i)) is None else str(c) for i in at], dtype=object
+        )
+        for cid in wanted:
+            category_cents[cid] = int(line_cents[categories == cid].sum())
+
+    subtotal = Decimal(int(line_cents.sum())) / 100
+    adjustments, total = apply_rules(
+        subtotal, {cid: Decimal(c) / 100 for cid, c in category_cents.items()}, catalog.pricing_rules
+    )
+    found_ids = [pid for pid, ok in zip(ids, found) if ok]
+    return PriceSnapshot(
+        catalog_version=catalog.version,
+        lines=tuple(
+            (pid, int(qty), int(c) / 100, int(lc) / 100)
+            for pid, qty, c, lc in zip(found_ids, quantities, cents, line_cents)
+        ),
+        subtotal=float(subtotal),
+        adjustments=tuple(adjustments),
+        total=total,
+        unavailable=tuple(pid for pid, ok in zip(ids, found) if not ok),
+    )
+
+
+def price_cart(cart, catalog) -> PriceSnapshot:
+    """Price the cart against this catalog, reusing the session's snapshot if nothing changed.
+
+    When only the catalog moved on and the new prices differ for the same
+    cart, ``session_state.prices_changed`` is set for the checkout to report.
+    """
+    items = tuple(sorted(cart.items()))
+    cached = st.session_state.get("price_snapshot")
+    if cached and cached[0] == (catalog.version, items):
+        return cached[1]
+    snapshot = _price(cart, catalog)
+    if cached and cached[0][1] == items and (cached[1].lines, cached[1].total) != (snapshot.lines, snapshot.total):
+        st.session_state["prices_changed"] = True
+    st.session_state["price_snapshot"] = ((catalog.version, items), snapshot)
+    return snapshot
@@ -0,0 +1,286 @@
+# product_columns.py
+"""Column-wise product storage for large catalogs.
+
+A catalog of row dicts costs about a kilobyte per product. Here each column
+is one array instead: numbers live in float64 NumPy arrays (NaN for NULL)
+and strings in lists of interned ``str``, so repeated values such as image
+hosts or attributions are stored once. Rows are handed out as lightweight
+read-only views over the columns, and filtering, sorting and slicing work
+on arrays of row positions without copying any product data.
+"""
+import sys
+from collections.abc import Mapping, Sequence
+from itertools import compress
+
+import numpy as np
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _intern(value):
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+class ProductColumns:
+    """The products table stored column by column."""
+
+    def __init__(self, rows):
+        rows = list(rows)
+        self.names = []
+        for row in rows:
+            for key in row.keys():
+                if key not in self.names:
+                    self.names.append(key)
+
+        self.numeric = {}  # column -> float64 array (NaN = NULL)
+        self.integer = set()  # numeric columns whose values are ints
+        self.text = {}  # column -> list of interned str / other values
+        for name in self.names:
+            values = [row.get(name) for row in rows]
+            present = [v for v in values if v is not None]
+            if present and all(_is_number(v) for v in present) and all(abs(v) < 2**53 for v in present):
+                self.numeric[name] = np.array([np.nan if v is None else v for v in values], dtype=np.float64)
+                if all(isinstance(v, int) for v in present):
+                    self.integer.add(name)
+            else:
+                self.text[name] = [_intern(v) for v in values]
+
+        self.size = len(rows)
+        self.all = np.arange(self.size)
+        self._build_id_index()
+
+    def _build_id_index(self):
+        # Numeric ids: binary search over a sorted copy, no per-row objects
+        if "id" in self.numeric:
+            self._id_order = np.argsort(self.numeric["id"], kind="stable")
+            self._sorted_ids = self.numeric["id"][self._id_order]
+            self._id_positions = None
+        else:
+            self._id_positions = {str(v): i for i, v in enumerate(self.text.get("id", []))}
+
+    def with_changes(self, upserts=(), deletes=()):
+        """Return new columns with ``upserts`` written and the ``deletes`` ids dropped.
+
+        ``upserts`` are row dicts matched on ``id``: a known id is overwritten
+        in place, a new one appended. Columns are copied as arrays and patched
+        at the touched positions, so a batch costs a few array copies rather
+        than a dict per product, and this object stays valid for readers
+        still using it. A value that doesn't fit its column (a string in a
+        numeric column, a new column) falls back to rebuilding from rows.
+        """
+        upserts = list(upserts)
+        dropped = {str(k) for k in deletes}
+        if not all(self._fits(row) for row in upserts):
+            rows = {str(r["id"]): r for r in self.to_rows()}
+            rows.update((str(r["id"]), r) for r in upserts)
+            return ProductColumns(r for k, r in rows.items() if k not in dropped)
+
+        at, appended = [], []
+        for row in upserts:
+            i = self.position(row["id"])
+            if i is None:
+                appended.append(row)
+            else:
+                at.append((i, row))
+        positions = np.array([i for i, _ in at], dtype=np.int64)
+
+        new = ProductColumns.__new__(ProductColumns)
+        new.names = list(self.names)
+        new.integer = set(self.integer)
+        new.numeric, new.text = {}, {}
+        for name, column in self.numeric.items():
+            values = [row.get(name) for _, row in at]
+            extra = [row.get(name) for row in appended]
+            if any(v is not None and not isinstance(v, int) for v in values + extra):
+                new.integer.discard(name)
+            column = np.concatenate([column, np.array([np.nan if v is None else v for v in extra], dtype=np.float64)])
+            column[positions] = [np.nan if v is None else v for v in values]
+            new.numeric[name] = column
+        for name, column in self.text.items():
+            column = column + [_intern(row.get(name)) for row in appended]
+            for i, row in at:
+                column[i] = _intern(row.get(name))
+            new.text[name] = column
+        new.size = self.size + len(appended)
+
+        gone = [i for k in dropped if (i := self.position(k)) is not None]
+        if gone:
+            keep = np.ones(new.size, dtype=bool)
+            keep[gone] = False
+            new.numeric = {name: column[keep] for name, column in new.numeric.items()}
+            flags = keep.tolist()
+            new.text = {name: list(compress(column, flags)) for name, column in new.text.items()}
+            new.size = int(keep.sum())
+
+        new.all = np.arange(new.size)
+        if appended or gone:
+            new._build_id_index()
+        else:
+            # Same ids at the same positions: share the index
+            new._id_order = getattr(self, "_id_order", None)
+            new._sorted_ids = getattr(self, "_sorted_ids", None)
+            new._id_positions = self._id_positions
+        return new
+
+    def _fits(self, row):
+        for name, v in row.items():
+            if name not in self.numeric and name not in self.text:
+                return False
+            if name in self.numeric and v is not None and not (_is_number(v) and abs(v) < 2**53):
+                return False
+        return True
+
+    def value(self, name, i):
+        """The Python value of column ``name`` in row ``i`` (None for NULL)."""
+        column = self.numeric.get(name)
+        if column is not None:
+            v = column[i]
+            if np.isnan(v):
+                return None
+            return int(v) if name in self.integer else float(v)
+        column = self.text.get(name)
+        return column[i] if column is not None else None
+
+    def position(self, product_id):
+        """Row position of the product with this id (str or int), or None."""
+        if self._id_positions is not None:
+            return self._id_positions.get(str(product_id))
+        try:
+            key = float(product_id)
+        except (TypeError, ValueError):
+            return None
+        j = np.searchsorted(self._sorted_ids, key)
+        if j < self.size and self._sorted_ids[j] == key:
+            return int(self._id_order[j])
+        return None
+
+    def column_values(self, name):
+        """All values of one column as Python objects (None for NULL)."""
+        if name in self.numeric:
+            cast = int if name in self.integer else float
+            return [None if v != v else cast(v) for v in self.numeric[name].tolist()]
+        return list(self.text[name])
+
+    def to_rows(self):
+        """Every product as a plain dict, in position order."""
+        columns = [self.column_values(name) for name in self.names]
+        return [dict(zip(self.names, values)) for values in zip(*columns)]
+
+    def row(self, i):
+        return ProductRow(self, int(i))
+
+    def view(self, positions=None):
+        return ProductView(self, self.all if positions is None else np.asarray(positions, dtype=np.int64))
+
+    def memory_report(self, sample=1000):
+        """Bytes used per column and per product, next to the row-dict equivalent."""
+        columns = {name: int(a.nbytes) for name, a in self.numeric.items()}
+        seen = set()
+        for name, values in self.text.items():
+            unique = 0
+            for v in values:
+                if isinstance(v, str) and id(v) not in seen:
+                    seen.add(id(v))
+                    unique += sys.getsizeof(v)
+            columns[name] = sys.getsizeof(values) + unique
+        index = int(self.all.nbytes)
+        if self._id_positions is None:
+            index += int(self._id_order.nbytes + self._sorted_ids.nbytes)
+        else:
+            index += sys.getsizeof(self._id_positions)
+
+        total = sum(columns.values()) + index
+        # Row dicts, as the catalog used to keep them: measure a sample
+        step = max(1, self.size // sample)
+        measured = [dict(self.row(i)) for i in range(0, self.size, step)]
+        per_dict = (
+            sum(sys.getsizeof(d) + sum(sys.getsizeof(v) for v in d.values()) for d in measured) / len(measured)
+            if measured else 0
+        )
+        return {
+            "products": self.size,
+            "columns": columns,
+            "index_bytes": index,
+            "total_bytes": total,
+            "bytes_per_product": total / self.size if self.size else 0,
+            "row_dict_bytes_per_product": per_dict,
+        }
+
+
+class ProductRow(Mapping):
+    """Read-only view of one product; behaves like the row dict it replaces."""
+
+    __slots__ = ("_columns", "_i")
+
+    def __init__(self, columns, i):
+        self._columns = columns
+        self._i = i
+
+    def __getitem__(self, name):
+        if name not in self._columns.numeric and name not in self._columns.text:
+            raise KeyError(name)
+        return self._columns.value(name, self._i)
+
+    def get(self, name, default=None):
+        value = self._columns.value(name, self._i)
+        return default if value is None else value
+
+    def __iter__(self):
+        return iter(self._columns.names)
+
+    def __len__(self):
+        return len(self._columns.names)
+
+    def __eq__(self, other):
+        if isinstance(other, ProductRow):
+            return self._columns is other._columns and self._i == other._i
+        return dict(self) == other
+
+    def __hash__(self):
+        return hash((id(self._columns), self._i))
+
+    def __repr__(self):
+        return f"ProductRow({dict(self)!r})"
+
+
+class ProductView(Sequence):
+    """An ordered selection of rows; slicing and filtering return new views."""
+
+    def __init__(self, columns, positions):
+        self.columns = columns
+        self.positions = positions
+
+    def __len__(self):
+        return len(self.positions)
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return ProductView(self.columns, self.positions[key])
+        return self.columns.row(self.positions[key])
+
+    def __iter__(self):
+        return (self.columns.row(i) for i in self.positions)
+
+    def numbers(self, name):
+        """This view's values of a numeric column (NaN for NULL)."""
+        return self.columns.numeric[name][self.positions]
+
+    def where(self, mask):
+        return ProductView(self.columns, self.positions[mask])
+
+    def sorted_by(self, name, desc=False):
+        """Stable sort on one column; NULLs go last either way."""
+        if name in self.columns.numeric:
+            values = self.numbers(name)
+            missing = np.isnan(values)
+            keys = np.where(missing, 0, -values if desc else values)
+            order = np.lexsort((keys, missing))
+        else:
+            text = self.columns.text.get(name, [None] * self.columns.size)
+            values = [text[i] for i in self.positions]
+            present = [j for j, v in enumerate(values) if v is not None]
+            present.sort(key=lambda j: values[j], reverse=desc)
+            order = present + [j for j, v in enumerate(values) if v is None]
+        return ProductView(self.columns, self.positions[np.asarray(order, dtype=np.int64)])
@@ -0,0 +1,326 @@
+# rollups.py
+import threading
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import pandas as pd
+import streamlit as st
+
+from supabase_config import fetch_pages
+
+PAGE_SIZE = int(st.secrets.get("ANALYTICS_PAGE_SIZE", 1000))
+# Orders this far behind the high-water mark are read again, to catch ones
+# whose transaction committed after a refresh had already moved past them
+LATE_SECONDS = float(st.secrets.get("ANALYTICS_LATE_SECONDS", 300))
+# Start over this often, picking up status changes and recategorised products (0 = never)
+REBUILD_SECONDS = float(st.secrets.get("ANALYTICS_REBUILD_SECONDS", 3600))
+IN_CHUNK = 200  # order ids per in_() filter, keeps URLs short
+# Requests in flight while ingesting: the next orders page, and this page's items and payments
+LOAD_WORKERS = int(st.secrets.get("ANALYTICS_LOAD_WORKERS", 5))
+
+# Fact table -> (key columns, summed value columns)
+FACT_COLUMNS = {
+    "orders": (["day", "status"], ["orders", "total"]),
+    "paid": (["day"], ["paid"]),
+    "items": (["day", "product_id", "category_id"], ["units", "revenue"]),
+    "category_orders": (["day", "category_id", "status"], ["orders"]),
+    "cohorts": (["cohort", "active"], ["customers"]),
+    "cohort_sizes": (["cohort"], ["customers", "repeat_customers"]),
+}
+INT_COLUMNS = {"orders", "units", "customers", "repeat_customers"}
+
+
+def _month_index(month):
+    return int(month[:4]) * 12 + int(month[5:7]) - 1
+
+
+def _month(index):
+    return f"{index // 12:04d}-{index % 12 + 1:02d}"
+
+
+def _in_range(df, column, start, end):
+    mask = pd.Series(True, index=df.index)
+    if start:
+        mask &= df[column] >= start
+    if end:
+        mask &= df[column] <= end
+    return df[mask]
+
+
+class SalesFacts:
+    """Sales pre-aggregated per day, product, category and customer cohort.
+
+    Every dashboard view (date range, category, daily or monthly) is
+    answered from these frames, whose size grows with days × products sold
+    and with customer months — never with the number of orders. Days are
+    ``YYYY-MM-DD`` strings; ids and statuses are strings, ``""`` for none.
+    """
+
+    def __init__(self, frames):
+        self.frames = {}
+        for name, (keys, values) in FACT_COLUMNS.items():
+            df = frames.get(name)
+            df = pd.DataFrame(columns=keys + values) if df is None or df.empty else df[keys + values].copy()
+            for column in keys:
+                df[column] = df[column].fillna("").astype(str)
+            for column in values:
+                df[column] = pd.to_numeric(df[column], errors="coerce").fillna(0)
+                df[column] = df[column].astype("int64" if column in INT_COLUMNS else "float64")
+            self.frames[name] = df
+
+    @classmethod
+    def from_records(cls, records) -> "SalesFacts":
+        """Build from ``{table: [row dict, ...]}`` (the dashboard_facts RPC's shape)."""
+        return cls({name: pd.DataFrame(rows or []) for name, rows in (records or {}).items()})
+
+    def to_frame(self) -> pd.DataFrame:
+        """All tables in one long frame (a ``table`` column tells them apart), for Parquet."""
+        return pd.concat(
+            [df.assign(table=name) for name, df in self.frames.items()], ignore_index=True
+        )
+
+    @classmethod
+    def from_frame(cls, df) -> "SalesFacts":
+        return cls({name: part for name, part in df.groupby("table")})
+
+    @property
+    def day_range(self):
+        """First and last day with orders, or None."""
+        days = self.frames["orders"]["day"]
+        days = days[days != ""]
+        return (days.min(), days.max()) if len(days) else None
+
+    def metrics(self, start=None, end=None, category_id=None, granularity="month",
+                product_name=None, category_names=None):
+        """Dashboard numbers for one view, as a dict for DashboardMetrics.from_dict.
+
+        ``start``/``end`` are inclusive ``YYYY-MM-DD`` days. With a category,
+        orders and statuses count orders containing it, and revenue is that
+        category's item revenue rather than payments. Cohorts (customers by
+        first-order month) follow the date range but not the category.
+        ``product_name(product_id)`` names the top products (None if unknown).
+        """
+        product_name = product_name or (lambda product_id: None)
+        category_names = category_names or {}
+        period = (lambda days: days.str[:7]) if granularity == "month" else (lambda days: days)
+        f = self.frames
+
+        items = _in_range(f["items"], "day", start, end)
+        if category_id is not None:
+            items = items[items["category_id"] == str(category_id)]
+            counted = _in_range(f["category_orders"], "day", start, end)
+            counted = counted[counted["category_id"] == str(category_id)]
+            total_orders = int(counted["orders"].sum())
+            status = counted.groupby("status")["orders"].sum()
+            total_revenue = float(items["revenue"].sum())
+            trend = items[items["day"] != ""].groupby(period(items["day"]))["revenue"].sum()
+        else:
+            orders = _in_range(f["orders"], "day", start, end)
+            total_orders = int(orders["orders"].sum())
+            status = orders.groupby("status")["orders"].sum()
+            total_revenue = float(_in_range(f["paid"], "day", start, end)["paid"].sum())
+            trend = orders[orders["day"] != ""].groupby(period(orders["day"]))["total"].sum()
+
+        top = items.groupby("product_id")["units"].sum().nlargest(5)
+        by_category = items.groupby("category_id")["revenue"].sum().sort_values(ascending=False)
+
+        return {
+            "total_revenue": total_revenue,
+            "total_orders": total_orders,
+            "status_counts": {k: int(v) for k, v in status.items() if k and v},
+            "top_products": {product_name(pid) or f"Product {pid}": int(v) for pid, v in top.items()},
+            "category_revenue": {
+                category_names.get(cid, f"Category {cid}") if cid else "Uncategorised": float(v)
+                for cid, v in by_category.items()
+            },
+            "sales_trend": {str(k): float(v) for k, v in trend.sort_index().items()},
+            "cohorts": self._cohorts(start, end),
+        }
+
+    def _cohorts(self, start, end):
+        sizes = _in_range(self.frames["cohort_sizes"], "cohort", start and start[:7], end and end[:7])
+        active = self.frames["cohorts"]
+        active = active[active["cohort"].isin(sizes["cohort"])]
+        cohorts = {
+            cohort: {"customers": int(n), "repeat_customers": int(r), "active": {}}
+            for cohort, n, r in zip(sizes["cohort"], sizes["customers"], sizes["repeat_customers"])
+        }
+        for cohort, month, n in zip(active["cohort"], active["active"], active["customers"]):
+            offset = _month_index(month) - _month_index(cohort)
+            cohorts[cohort]["active"][offset] = int(n)
+        return dict(sorted(cohorts.items()))
+
+
+class SalesRollup:
+    """Sales facts kept up to date from a ``created_at`` high-water mark.
+
+    Each refresh reads only orders newer than the last one seen, a page at
+    a time, with the items and payments of each page, and folds them into
+    the per-day aggregates — so memory holds a page or two of rows plus the
+    aggregates, however long the history. The next orders page and the
+    current page's items and payments are fetched on ``workers`` threads
+    while the main thread folds.
+
+    ``created_at`` is set when an order's transaction starts, not when it
+    commits, so the last ``late_seconds`` are read again on every refresh
+    and orders already folded in are skipped by id. Order status and
+    product category are taken as they were when the order was ingested;
+    every ``rebuild_seconds`` the aggregates are rebuilt from scratch to
+    pick up later changes.
+    """
+
+    def __init__(self, supabase, late_seconds=LATE_SECONDS, rebuild_seconds=REBUILD_SECONDS,
+                 workers=LOAD_WORKERS):
+        self._supabase = supabase
+        self.workers = max(1, workers)
+        self.late_seconds = late_seconds
+        self.rebuild_seconds = rebuild_seconds
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self.orders = defaultdict(lambda: [0, 0.0])  # (day, status) -> [orders, total]
+        self.paid = defaultdict(float)  # day -> payments
+        self.items = defaultdict(lambda: [0, 0.0])  # (day, product_id, category_id) -> [units, revenue]
+        self.category_orders = Counter()  # (day, category_id, status) -> orders
+        # user_id -> [first month index, orders, bitmask of active months since the first]
+        self.customers = {}
+        self.high_water = None  # newest created_at seen, as a datetime
+        self._recent = {}  # order id -> created_at, for orders inside the late window
+        self.built_at = time.monotonic()
+
+    def rebuild(self, category_of=None):
+        with self._lock:
+            self._reset()
+        return self.refresh(category_of)
+
+    def _window_start(self):
+        """Where the next read starts: ``late_seconds`` before the high-water mark."""
+        if self.high_water is None:
+            return None
+        return self.high_water - timedelta(seconds=self.late_seconds)
+
+    def refresh(self, category_of=None):
+        """Fold in orders created since the last refresh. Returns how many were new.
+
+        ``category_of(product_id)`` gives a product's category id (or None).
+        """
+        category_of = category_of or (lambda product_id: None)
+        with self._lock:
+            if self.rebuild_seconds and time.monotonic() - self.built_at >= self.rebuild_seconds:
+                self._reset()
+            since = self._window_start()
+
+            def request():
+                r = self._supabase.table("orders").select("id,user_id,created_at,total,status")
+                if since is not None:
+                    r = r.gte("created_at", since.isoformat())
+                return r.order("created_at").order("id")
+
+            new = 0
+            with ThreadPoolExecutor(self.workers, thread_name_prefix="rollup") as pool:
+                for page in _prefetched(pool, fetch_pages(request, PAGE_SIZE)):
+                    orders = [o for o in page if o["id"] not in self._recent]
+                    if orders:
+                        self._fold(orders, category_of, pool)
+                        new += len(orders)
+                    self._recent.update((o["id"], datetime.fromisoformat(o["created_at"])) for o in page)
+                    newest = self._recent[page[-1]["id"]]
+                    self.high_water = newest if self.high_water is None else max(self.high_water, newest)
+                    # Keep only the ids a later read can see again
+                    start = self._window_start()
+                    self._recent = {oid: at for oid, at in self._recent.items() if at >= start}
+            return new
+
+    def _fold(self, orders, category_of, pool):
+        day_of, status_of = {}, {}
+        for o in orders:
+            day = str(o.get("created_at") or "")[:10]
+            status = o.get("status") or ""
+            day_of[o["id"]], status_of[o["id"]] = day, status
+            cell = self.orders[day, status]
+            cell[0] += 1
+            cell[1] += o.get("total") or 0
+
+            user = o.get("user_id")
+            if user and day:
+                month = _month_index(day)
+                customer = self.customers.setdefault(str(user), [month, 0, 0])
+                if month < customer[0]:  # older than the first order seen (rebuilds never do this)
+                    customer[2] <<= customer[0] - month
+                    customer[0] = month
+                customer[1] += 1
+                customer[2] |= 1 << (month - customer[0])
+
+        ids = list(day_of)
+        chunks = [ids[i:i + IN_CHUNK] for i in range(0, len(ids), IN_CHUNK)]
+        items = [pool.submit(self._rows, "order_items", "order_id,product_id,quantity,price,subtotal", c)
+                 for c in chunks]
+        payments = [pool.submit(self._rows, "payment", "order_id,amount", c) for c in chunks]
+        categories = defaultdict(set)  # order id -> categories of its items
+        for item in (item for rows in items for item in rows.result()):
+            oid, pid = item["order_id"], str(item["product_id"])
+            category = category_of(pid)
+            category = "" if category is None else str(category)
+            qty = item.get("quantity") or 0
+            revenue = item.get("subtotal")
+            cell = self.items[day_of[oid], pid, category]
+            cell[0] += qty
+            cell[1] += revenue if revenue is not None else (item.get("price") or 0) * qty
+            if category:
+                categories[oid].add(category)
+        for oid, found in categories.items():
+            for category in found:
+                self.category_orders[day_of[oid], category, status_of[oid]] += 1
+        for rows in payments:
+            for pay in rows.result():
+                self.paid[day_of[pay["order_id"]]] += pay.get("amount") or 0
+
+    def _rows(self, table, columns, order_ids):
+        """Rows of ``table`` for one chunk of order ids."""
+        request = lambda: self._supabase.table(table).select(columns).in_("order_id", order_ids).order("id")
+        return [row for page in fetch_pages(request, PAGE_SIZE) for row in page]
+
+    def facts(self) -> SalesFacts:
+        """A snapshot of the aggregates as :class:`SalesFacts`."""
+        with self._lock:
+            cohorts, sizes = Counter(), defaultdict(lambda: [0, 0])
+            for first, n, months in self.customers.values():
+                size = sizes[_month(first)]
+                size[0] += 1
+                size[1] += n >= 2
+                offset = 0
+                while months:
+                    if months & 1:
+                        cohorts[_month(first), _month(first + offset)] += 1
+                    months >>= 1
+                    offset += 1
+            records = {
+                "orders": [{"day": d, "status": s, "orders": n, "total": t}
+                           for (d, s), (n, t) in self.orders.items()],
+                "paid": [{"day": d, "paid": v} for d, v in self.paid.items()],
+                "items": [{"day": d, "product_id": p, "category_id": c, "units": u, "revenue": r}
+                          for (d, p, c), (u, r) in self.items.items()],
+                "category_orders": [{"day": d, "category_id": c, "status": s, "orders": n}
+                                    for (d, c, s), n in self.category_orders.items()],
+                "cohorts": [{"cohort": c, "active": a, "customers": n} for (c, a), n in cohorts.items()],
+                "cohort_sizes": [{"cohort": c, "customers": n, "repeat_customers": r}
+                                 for c, (n, r) in sizes.items()],
+            }
+        return SalesFacts.from_records(records)
+
+
+def _prefetched(pool, pages):
+    """Yield from the ``pages`` iterator while the next page is fetched on ``pool``."""
+    future = pool.submit(next, pages, None)
+    while (page := future.result()) is not None:
+        future = pool.submit(next, pages, None)
+        yield page
+
+
+@st.cache_resource
+def get_sales_rollup(_supabase) -> SalesRollup:
+    """Return the rollup shared by every dashboard viewer in this process."""
+    return SalesRollup(_supabase)
@@ -0,0 +1,148 @@
+# search.py
+import difflib
+import re
+from bisect import bisect_left
+
+import streamlit as st
+
+from grid import GRID_COLUMNS
+
+_TOKEN = re.compile(r"\w+")
+
+# Matches in the product name count more than matches in the description
+FIELD_WEIGHTS = (("name", 3), ("description", 1))
+
+SEARCH_BACKEND = st.secrets.get("SEARCH_BACKEND", "memory")  # "memory" or "postgres"
+SEARCH_FUZZY = bool(st.secrets.get("SEARCH_FUZZY", False))
+# Best matches fetched per query with SEARCH_BACKEND = "postgres"
+SEARCH_LIMIT = int(st.secrets.get("SEARCH_LIMIT", 200))
+
+
+def tokenize(text):
+    return _TOKEN.findall((text or "").lower())
+
+
+def _weights(product):
+    """Token -> summed field weight for one product."""
+    weights = {}
+    for field, weight in FIELD_WEIGHTS:
+        for token in tokenize(product.get(field)):
+            weights[token] = weights.get(token, 0) + weight
+    return weights
+
+
+class SearchIndex:
+    """Inverted token index over product names and descriptions.
+
+    Built once per catalog load and patched by :meth:`with_changes`. Every
+    query word must match (as a whole token or a token prefix); results are
+    ranked by weighted hits.
+    """
+
+    def __init__(self, products, _postings=None, _vocab=None):
+        # products: {str(id): product}, e.g. the catalog's ProductLookup
+        self.products = products
+        if _postings is None:
+            _postings = {}
+            for pid, p in products.items():
+                for token, weight in _weights(p).items():
+                    _postings.setdefault(token, {})[pid] = weight
+        self._postings = _postings
+        self._vocab = _vocab if _vocab is not None else sorted(_postings)
+
+    def with_changes(self, products, removed, added):
+        """Return a new index for ``products`` after ``removed``/``added`` rows changed.
+
+        Only the posting lists of touched tokens are copied; the rest are
+        shared with this index, which stays valid for readers still using it.
+        ``products`` is kept as given, so pass a lookup rather than a dict.
+        """
+        postings = dict(self._postings)
+        for p in removed:
+            pid = str(p["id"])
+            for token in _weights(p):
+                entry = dict(postings.get(token, {}))
+                entry.pop(pid, None)
+                if entry:
+                    postings[token] = entry
+                else:
+                    postings.pop(token, None)
+        for p in added:
+            pid = str(p["id"])
+            for token, weight in _weights(p).items():
+                entry = dict(postings.get(token, {}))
+                entry[pid] = weight
+                postings[token] = entry
+        # Edits rarely add or drop a word; keep the sorted vocabulary then
+        vocab = self._vocab if postings.keys() == self._postings.keys() else None
+        return SearchIndex(products, _postings=postings, _vocab=vocab)
+
+    def _expand(self, term, fuzzy):
+        """Return ``[(token, boost), ...]`` for index tokens matching a query term."""
+        matches = []
+        for j in range(bisect_left(self._vocab, term), len(self._vocab)):
+            token = self._vocab[j]
+            if not token.startswith(term):
+                break
+            matches.append((token, 2 if token == term else 1))
+
+        if not matches and fuzzy:
+            close = difflib.get_close_matches(term, self._vocab, n=3, cutoff=0.8)
+            matches = [(token, 0.5) for token in close]
+        return matches
+
+    def search(self, query, fuzzy=False, limit=None):
+        """Return products matching every word of ``query``, best first."""
+        return [self.products[pid] for pid in self.search_ids(query, fuzzy, limit)]
+
+    def search_ids(self, query, fuzzy=False, limit=None):
+        """Like :meth:`search`, but return the matching product ids."""
+        terms = tokenize(query)
+        if not terms:
+            return list(self.products)
+
+        scores = None
+        for term in terms:
+            term_scores = {}
+            for token, boost in self._expand(term, fuzzy):
+                for pid, weight in self._postings[token].items():
+                    term_scores[pid] = term_scores.get(pid, 0) + weight * boost
+
+            if scores is None:
+                scores = term_scores
+            else:
+                scores = {pid: s + term_scores[pid] for pid, s in scores.items() if pid in term_scores}
+            if not scores:
+                return []
+
+        ranked = sorted(scores, key=lambda pid: (-scores[pid], self.products[pid].get("name") or "", pid))
+        if limit:
+            ranked = ranked[:limit]
+        return ranked
+
+
+def search_products_db(supabase, query, category_id=None, limit=SEARCH_LIMIT):
+    """Run the search in Postgres full-text search (see sql/product_search.sql).
+
+    Returns ``(products, truncated)``: the best ``limit`` matches by rank,
+    and whether more matched.
+    """
+    rows = supabase.rpc("search_products", {
+        "p_query": query,
+        "p_category_id": None if category_id is None else str(category_id),
+    }).select(GRID_COLUMNS).limit(limit + 1).execute().data
+    return rows[:limit], len(rows) > limit
+
+
+def search_products(supabase, catalog, query, category_id=None):
+    """Search the catalog with the configured backend, optionally within one category.
+
+    Returns ``(products, truncated)``; only the Postgres backend truncates.
+    """
+    if SEARCH_BACKEND == "postgres":
+        return search_products_db(supabase, query, category_id)
+
+    results = catalog.view_of(catalog.search_index.search_ids(query, fuzzy=SEARCH_FUZZY))
+    if category_id is not None:
+        results = catalog.in_category(category_id, results)
+    return results, False
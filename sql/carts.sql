@@ -0,0 +1,83 @@
+-- Server-side carts, stored compactly as {"<product_id>": quantity}.
+--
+-- Logged-in carts are keyed by the user id. Anonymous carts are keyed by a
+-- random token the browser keeps, so the table is only reachable through
+-- these functions (RLS on, no policies).
+
+create table if not exists carts (
+    owner text primary key,               -- 'user:<uuid>' or 'anon:<token>'
+    items jsonb not null default '{}',
+    updated_at timestamptz not null default now()
+);
+
+alter table carts enable row level security;
+
+create or replace function cart_owner(p_anon_token text)
+returns text
+language plpgsql
+stable
+as $$
+begin
+    if auth.uid() is not null then
+        return 'user:' || auth.uid();
+    end if;
+    if p_anon_token is null or length(p_anon_token) < 32 then
+        raise exception 'A cart token is required for anonymous carts';
+    end if;
+    return 'anon:' || p_anon_token;
+end;
+$$;
+
+create or replace function load_cart(p_anon_token text default null)
+returns jsonb
+language sql
+stable
+security definer
+set search_path = public
+as $$
+    select coalesce((select items from carts where owner = cart_owner(p_anon_token)), '{}'::jsonb);
+$$;
+
+create or replace function save_cart(p_items jsonb, p_anon_token text default null)
+returns void
+language sql
+security definer
+set search_path = public
+as $$
+    insert into carts (owner, items, updated_at)
+    values (cart_owner(p_anon_token), p_items, now())
+    on conflict (owner) do update set items = excluded.items, updated_at = now();
+$$;
+
+-- Fold an anonymous cart into the caller's user cart (quantities add up)
+-- and return the merged cart.
+create or replace function merge_cart(p_anon_token text)
+returns jsonb
+language plpgsql
+security definer
+set search_path = public
+as $$
+declare
+    v_owner text;
+    v_merged jsonb;
+begin
+    if auth.uid() is null then
+        raise exception 'You must be logged in to merge a cart';
+    end if;
+    v_owner := 'user:' || auth.uid();
+
+    select coalesce(jsonb_object_agg(key, qty), '{}'::jsonb) into v_merged
+      from (select key, sum(value::int) as qty
+              from carts, jsonb_each_text(items)
+             where owner in (v_owner, 'anon:' || p_anon_token)
+             group by key) t;
+
+    delete from carts where owner = 'anon:' || p_anon_token;
+
+    insert into carts (owner, items, updated_at)
+    values (v_owner, v_merged, now())
+    on conflict (owner) do update set items = excluded.items, updated_at = now();
+
+    return v_merged;
+end;
+$$;
@@ -0,0 +1,8 @@
+-- Publish product and category changes to Supabase Realtime, used when
+-- CATALOG_FEED = "realtime". Replica identity full makes DELETE events
+-- carry the whole old row.
+
+alter publication supabase_realtime add table products, categories;
+
+alter table products replica identity full;
+alter table categories replica identity full;
@@ -0,0 +1,80 @@
+-- dashboard_facts: the analytics dashboard's per-day aggregates in one JSON
+-- document, used when ANALYTICS_SOURCE = "postgres".
+--
+-- Every table is grouped by day (and status, product, category or cohort),
+-- so the response grows with days × products sold and with customer
+-- months, not with the number of orders. The app filters it by date range
+-- and category (rollups.SalesFacts). Replaces dashboard_metrics().
+
+drop function if exists dashboard_metrics();
+
+create or replace function dashboard_facts()
+returns jsonb
+language sql
+stable
+security invoker
+as $$
+    with o as (
+        select id, user_id, total,
+               coalesce(to_char(created_at, 'YYYY-MM-DD'), '') as day,
+               coalesce(status, '') as status
+          from orders
+    ),
+    i as (
+        select o.day, o.status, i.order_id,
+               i.product_id::text as product_id,
+               coalesce(p.category_id::text, '') as category_id,
+               coalesce(i.quantity, 0) as units,
+               coalesce(i.subtotal, i.price * i.quantity, 0) as revenue
+          from order_items i
+          join o on o.id = i.order_id
+          left join products p on p.id = i.product_id
+    ),
+    customers as (
+        select user_id, left(min(day), 7) as cohort, count(*) as orders
+          from o
+         where user_id is not null and day <> ''
+         group by user_id
+    ),
+    active as (
+        select distinct user_id, left(day, 7) as month
+          from o
+         where user_id is not null and day <> ''
+    )
+    select jsonb_build_object(
+        'orders', (
+            select coalesce(jsonb_agg(t), '[]'::jsonb)
+              from (select day, status, count(*) as orders, coalesce(sum(total), 0) as total
+                      from o group by 1, 2) t
+        ),
+        'paid', (
+            select coalesce(jsonb_agg(t), '[]'::jsonb)
+              from (select o.day, coalesce(sum(pay.amount), 0) as paid
+                      from payment pay join o on o.id = pay.order_id
+                     group by 1) t
+        ),
+        'items', (
+            select coalesce(jsonb_agg(t), '[]'::jsonb)
+              from (select day, product_id, category_id, sum(units) as units, sum(revenue) as revenue
+                      from i group by 1, 2, 3) t
+        ),
+        'category_orders', (
+            select coalesce(jsonb_agg(t), '[]'::jsonb)
+              from (select day, category_id, status, count(distinct order_id) as orders
+                      from i where category_id <> ''
+                     group by 1, 2, 3) t
+        ),
+        'cohorts', (
+            select coalesce(jsonb_agg(t), '[]'::jsonb)
+              from (select c.cohort, a.month as active, count(*) as customers
+                      from customers c join active a using (user_id)
+                     group by 1, 2) t
+        ),
+        'cohort_sizes', (
+            select coalesce(jsonb_agg(t), '[]'::jsonb)
+              from (select cohort, count(*) as customers,
+                           count(*) filter (where orders >= 2) as repeat_customers
+                      from customers group by 1) t
+        )
+    );
+$$;
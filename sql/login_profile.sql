@@ -0,0 +1,30 @@
+-- login_profile: one call after sign-in that makes sure the caller's users
+-- row exists, stamps last_login and returns the profile as it was *before*
+-- this login (so a null last_login still means "first visit").
+--
+-- Relies on the users RLS policies letting a user insert, select and update
+-- their own row (auth.uid() = id).
+
+create or replace function login_profile()
+returns users
+language plpgsql
+security invoker
+as $$
+declare
+    v_profile users;
+begin
+    insert into users (id, email, full_name)
+    values (
+        auth.uid(),
+        auth.jwt() ->> 'email',
+        coalesce(auth.jwt() -> 'user_metadata' ->> 'full_name', 'User')
+    )
+    on conflict (id) do nothing;
+
+    select * into v_profile from users where id = auth.uid();
+
+    update users set last_login = now() where id = auth.uid();
+
+    return v_profile;
+end;
+$$;
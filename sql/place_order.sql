@@ -0,0 +1,86 @@
+-- place_order: writes an order, its items and the payment in one transaction.
+--
+-- Prices are read from the products table, not trusted from the client, and
+-- discounts and tax come from price_items() (run pricing.sql first). The
+-- client sends the unit prices and total it showed the user; if either no
+-- longer matches, the order is refused with 'Prices changed' rather than
+-- charged at a price the user never saw.
+-- The idempotency key makes retries and double-clicks return the order that
+-- was already placed instead of creating a second one.
+
+alter table orders add column if not exists idempotency_key uuid;
+
+create unique index if not exists orders_user_idempotency_key
+    on orders (user_id, idempotency_key);
+
+drop function if exists place_order(uuid, jsonb, text);
+
+create or replace function place_order(
+    p_idempotency_key uuid,
+    p_items jsonb,            -- [{"product_id": "...", "quantity": 2, "unit_price": 9.99}, ...]
+    p_payment_method text,
+    p_expected_total numeric default null
+)
+returns jsonb
+language plpgsql
+security invoker
+as $$
+declare
+    v_user uuid := auth.uid();
+    v_order_id orders.id%type;
+    v_total numeric;
+    v_priced jsonb;
+begin
+    if v_user is null then
+        raise exception 'You must be logged in to place an order';
+    end if;
+
+    -- Already placed with this key: hand back the existing order
+    select id, total into v_order_id, v_total
+      from orders
+     where user_id = v_user and idempotency_key = p_idempotency_key;
+    if found then
+        return jsonb_build_object('order_id', v_order_id, 'total', v_total, 'duplicate', true);
+    end if;
+
+    if exists (
+        select 1
+          from jsonb_to_recordset(p_items) as i(product_id text, quantity int, unit_price numeric)
+          join products p on p.id::text = i.product_id
+         where i.quantity > 0 and i.unit_price is not null and i.unit_price <> coalesce(p.price, 0)
+    ) then
+        raise exception 'Prices changed' using hint = 'prices_changed';
+    end if;
+
+    v_priced := price_items(p_items);
+    v_total := (v_priced->>'total')::numeric;
+    if p_expected_total is not null and v_total <> p_expected_total then
+        raise exception 'Prices changed' using hint = 'prices_changed';
+    end if;
+
+    insert into orders (user_id, total, status, payment_status, idempotency_key, adjustments)
+    values (v_user, v_total, 'completed', 'paid', p_idempotency_key, v_priced->'adjustments')
+    on conflict (user_id, idempotency_key) do nothing
+    returning id into v_order_id;
+
+    -- Placed concurrently with the same key
+    if v_order_id is null then
+        select id, total into v_order_id, v_total
+          from orders
+         where user_id = v_user and idempotency_key = p_idempotency_key;
+        return jsonb_build_object('order_id', v_order_id, 'total', v_total, 'duplicate', true);
+    end if;
+
+    insert into order_items (order_id, product_id, quantity, price, subtotal)
+    select v_order_id, p.id, i.quantity, coalesce(p.price, 0), coalesce(p.price, 0) * i.quantity
+      from jsonb_to_recordset(p_items) as i(product_id text, quantity int)
+      join products p on p.id::text = i.product_id
+     where i.quantity > 0;
+
+    insert into payment (order_id, amount, method, status, transaction_ref)
+    values (v_order_id, v_total, p_payment_method, 'paid',
+            'TX-' || v_order_id || '-' || left(v_user::text, 6));
+
+    return jsonb_build_object('order_id', v_order_id, 'total', v_total, 'duplicate', false);
+end;
+$$;
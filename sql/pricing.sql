@@ -0,0 +1,78 @@
+-- pricing: discount and tax rules, and price_items() which applies them.
+--
+-- The app loads the active rules with the catalog and prices the cart with
+-- the same arithmetic (pricing.py) so the checkout shows exactly what
+-- place_order will charge. Rules apply in position order to the running
+-- total; amounts are rounded to cents, half away from zero.
+--
+--   percent_off           percent off the running total
+--   category_percent_off  percent off the lines in category_id
+--   tax                   percent added to the running total
+--
+-- A rule only applies when the cart subtotal is at least min_subtotal.
+-- Run this before place_order.sql.
+
+create table if not exists pricing_rules (
+    id bigint generated always as identity primary key,
+    position int not null default 0,
+    kind text not null check (kind in ('percent_off', 'category_percent_off', 'tax')),
+    percent numeric not null check (percent >= 0),
+    min_subtotal numeric not null default 0,
+    category_id text,         -- category_percent_off only
+    label text not null default '',
+    active boolean not null default true
+);
+
+alter table pricing_rules enable row level security;
+
+drop policy if exists "Pricing rules are readable by everyone" on pricing_rules;
+create policy "Pricing rules are readable by everyone"
+    on pricing_rules for select using (true);
+
+alter table orders add column if not exists adjustments jsonb;
+
+create or replace function price_items(p_items jsonb)   -- [{"product_id": "...", "quantity": 2}, ...]
+returns jsonb
+language plpgsql
+stable
+security invoker
+as $$
+declare
+    v_subtotal numeric;
+    v_running numeric;
+    v_amount numeric;
+    v_adjustments jsonb := '[]'::jsonb;
+    r pricing_rules%rowtype;
+begin
+    select coalesce(sum(coalesce(p.price, 0) * i.quantity), 0)
+      into v_subtotal
+      from jsonb_to_recordset(p_items) as i(product_id text, quantity int)
+      join products p on p.id::text = i.product_id
+     where i.quantity > 0;
+    v_running := v_subtotal;
+
+    for r in select * from pricing_rules where active order by position, id loop
+        continue when v_subtotal < r.min_subtotal;
+
+        if r.kind = 'percent_off' then
+            v_amount := -round(v_running * r.percent / 100, 2);
+        elsif r.kind = 'category_percent_off' then
+            select -round(coalesce(sum(coalesce(p.price, 0) * i.quantity), 0) * r.percent / 100, 2)
+              into v_amount
+              from jsonb_to_recordset(p_items) as i(product_id text, quantity int)
+              join products p on p.id::text = i.product_id
+             where i.quantity > 0 and p.category_id::text = r.category_id;
+        else
+            v_amount := round(v_running * r.percent / 100, 2);
+        end if;
+
+        if v_amount <> 0 then
+            v_adjustments := v_adjustments || jsonb_build_array(jsonb_build_object(
+                'label', coalesce(nullif(r.label, ''), r.kind), 'amount', v_amount));
+            v_running := v_running + v_amount;
+        end if;
+    end loop;
+
+    return jsonb_build_object('subtotal', v_subtotal, 'adjustments', v_adjustments, 'total', v_running);
+end;
+$$;
@@ -0,0 +1,26 @@
+-- Full-text search column for products, used when SEARCH_BACKEND = "postgres".
+-- Names weigh more than descriptions, matching the in-memory search index.
+
+alter table products add column if not exists fts tsvector
+    generated always as (
+        setweight(to_tsvector('english', coalesce(name, '')), 'A') ||
+        setweight(to_tsvector('english', coalesce(description, '')), 'B')
+    ) stored;
+
+create index if not exists products_fts_idx on products using gin (fts);
+
+-- search_products: ranked matches for SEARCH_BACKEND = "postgres". The app
+-- selects only the grid columns (not fts) and asks for one row more than it
+-- shows, to tell when the list is cut short.
+create or replace function search_products(p_query text, p_category_id text default null)
+returns setof products
+language sql
+stable
+security invoker
+as $$
+    select p.*
+      from products p, websearch_to_tsquery('english', p_query) q
+     where p.fts @@ q
+       and (p_category_id is null or p.category_id::text = p_category_id)
+     order by ts_rank(p.fts, q) desc, p.id;
+$$;
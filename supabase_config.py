@@ -1,11 +1,119 @@
+import httpx
 import streamlit as st
-from supabase import create_client, Client
+from supabase import create_client, Client, ClientOptions
+from tracing import trace_client
 
+# "supabase" (a real project) or "memory" (memory_backend.py, no project needed)
+SUPABASE_BACKEND = st.secrets.get("SUPABASE_BACKEND", "supabase")
 SUPABASE_URL = st.secrets.get("SUPABASE_URL")
 SUPABASE_KEY = st.secrets.get("SUPABASE_ANON_KEY")
 
-if not SUPABASE_URL or not SUPABASE_KEY:
-    raise ValueError("❌ Missing SUPABASE_URL or SUPABASE_ANON_KEY in Streamlit Secrets.")
+if SUPABASE_BACKEND == "supabase" and (not SUPABASE_URL or not SUPABASE_KEY):
+    raise ValueError(
+        "❌ Missing SUPABASE_URL or SUPABASE_ANON_KEY in Streamlit Secrets "
+        "(or set SUPABASE_BACKEND = \"memory\" to run without a project)."
+    )
+
+POOL_SIZE = int(st.secrets.get("SUPABASE_POOL_SIZE", 20))
+TIMEOUT_SECONDS = float(st.secrets.get("SUPABASE_TIMEOUT_SECONDS", 10))
+KEEPALIVE_SECONDS = float(st.secrets.get("SUPABASE_KEEPALIVE_SECONDS", 60))
+
+MEMORY_LATENCY_MS = float(st.secrets.get("MEMORY_LATENCY_MS", 0))
+MEMORY_SEED = {
+    "products": int(st.secrets.get("MEMORY_SEED_PRODUCTS", 200)),
+    "categories": int(st.secrets.get("MEMORY_SEED_CATEGORIES", 8)),
+    "orders": int(st.secrets.get("MEMORY_SEED_ORDERS", 1000)),
+}
+
+
+@st.cache_resource
+def get_http_pool() -> httpx.Client:
+    """One keep-alive connection pool shared by every Supabase client in the process."""
+    return httpx.Client(
+        limits=httpx.Limits(
+            max_connections=POOL_SIZE,
+            max_keepalive_connections=POOL_SIZE,
+            keepalive_expiry=KEEPALIVE_SECONDS,
+        ),
+        timeout=httpx.Timeout(TIMEOUT_SECONDS),
+    )
+
+
+def _client_options(**kwargs) -> ClientOptions:
+    return ClientOptions(
+        httpx_client=get_http_pool(),
+        postgrest_client_timeout=TIMEOUT_SECONDS,
+        **kwargs,
+    )
+
+
+@st.cache_resource
+def get_memory_store():
+    """The in-memory tables every "memory" client shares, seeded once per process."""
+    from memory_backend import MemoryStore, seed_data
+    return MemoryStore(seed_data(**MEMORY_SEED), latency_ms=MEMORY_LATENCY_MS)
+
+
+def _supabase_client(**options) -> Client:
+    return create_client(SUPABASE_URL, SUPABASE_KEY, _client_options(**options))
+
+
+def _memory_client(**options):
+    return get_memory_store().client()
+
+
+# Backend name -> factory taking ClientOptions keywords. A backend must provide
+# the client surface documented at the top of memory_backend.py.
+BACKENDS = {
+    "supabase": _supabase_client,
+    "memory": _memory_client,
+}
+
+if SUPABASE_BACKEND not in BACKENDS:
+    raise ValueError(f"❌ Unknown SUPABASE_BACKEND {SUPABASE_BACKEND!r}; expected one of {', '.join(BACKENDS)}.")
+
+
+def create_backend_client(**options) -> Client:
+    """Create a client for the configured SUPABASE_BACKEND (traced when TRACING is on)."""
+    return trace_client(BACKENDS[SUPABASE_BACKEND](**options))
+
+
+@st.cache_resource
+def get_supabase() -> Client:
+    """Shared client for public reads (catalog, analytics).
+
+    Never sign in on this client — it is used by every session at once.
+    """
+    return create_backend_client(auto_refresh_token=False, persist_session=False)
+
+
+def get_session_supabase() -> Client:
+    """Client holding the current browser session's auth state.
+
+    It reuses the shared connection pool, so creating one costs no extra
+    connections or TLS handshakes. Tokens are refreshed by
+    auth_helpers.get_current_user rather than a timer thread per session.
+    """
+    if "_supabase" not in st.session_state:
+        st.session_state["_supabase"] = create_backend_client(auto_refresh_token=False)
+    return st.session_state["_supabase"]
+
+
+def fetch_pages(make_request, page_size=1000):
+    """Yield successive pages of rows using range requests.
+
+    ``make_request`` must build a fresh, ordered select each call. Paging
+    keeps large tables from being cut off at PostgREST's max-rows limit.
+    """
+    start = 0
+    while True:
+        page = make_request().range(start, start + page_size - 1).execute().data
+        if page:
+            yield page
+        if len(page) < page_size:
+            return
+        start += page_size
+
 
 def init_supabase() -> Client:
-    return create_client(SUPABASE_URL, SUPABASE_KEY)
+    return get_supabase()
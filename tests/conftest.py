@@ -0,0 +1,9 @@
+# tests/conftest.py
+import sys
+from pathlib import Path
+
+from streamlit import config
+
+# The app's modules are top-level files that read st.secrets on import
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+config.set_option("secrets.files", [str(Path(__file__).with_name("secrets.toml"))])
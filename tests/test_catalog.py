@@ -0,0 +1,37 @@
+# tests/test_catalog.py
+"""Loading and caching the shared catalog (catalog.py)."""
+import threading
+import time
+
+import memory_backend
+from catalog import Catalog, CatalogCache, _fetch_catalog
+
+
+def test_concurrent_misses_share_one_load():
+    loads = []
+
+    def loader():
+        loads.append(1)
+        time.sleep(0.1)
+        return Catalog([], [{"id": 1, "name": "Mug", "price": 5.0}])
+
+    cache = CatalogCache(loader)
+    sessions = [threading.Thread(target=cache.get) for _ in range(8)]
+    for t in sessions:
+        t.start()
+    for t in sessions:
+        t.join()
+
+    assert len(loads) == 1
+    assert cache.get().get(1)["name"] == "Mug"
+
+
+def test_fetch_reads_products_a_page_at_a_time():
+    # PostgREST caps each response at max-rows (1000 by default)
+    store = memory_backend.MemoryStore(memory_backend.seed_data(products=2500, orders=0))
+
+    catalog = _fetch_catalog(store.client())
+
+    assert len(catalog.products) == 2500
+    assert catalog.get(2500) is not None
+    assert store.requests == 5  # categories, 3 product pages, pricing rules
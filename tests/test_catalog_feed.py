@@ -0,0 +1,93 @@
+# tests/test_catalog_feed.py
+"""Change-feed updates to the shared catalog cache (catalog_feed.py, catalog.py)."""
+import threading
+
+import pytest
+
+import catalog_feed
+from catalog import Catalog, CatalogCache
+from catalog_feed import CatalogFeed
+
+PRODUCTS = [{"id": i, "name": f"Product {i}", "price": float(i), "category_id": 1} for i in range(1, 6)]
+
+
+@pytest.fixture(autouse=True)
+def quick_batches(monkeypatch):
+    monkeypatch.setattr(catalog_feed, "BATCH_SECONDS", 0.01)
+
+
+def _cache(loads, ttl=300):
+    def loader():
+        loads.append(1)
+        return Catalog([{"id": 1, "name": "Kitchen"}], [dict(p) for p in PRODUCTS])
+    return CatalogCache(loader, ttl=ttl)
+
+
+def test_published_changes_reach_the_cache():
+    loads = []
+    cache = _cache(loads, ttl=0)
+    cache.get()
+    feed = CatalogFeed(cache)
+    feed.start()
+
+    feed.publish("products", "UPDATE", {"id": 2, "name": "Teapot", "price": 9.5, "category_id": 1})
+    feed.publish("products", "INSERT", {"id": 6, "name": "Kettle", "price": 30.0, "category_id": 1})
+    feed.publish("products", "DELETE", old_record={"id": 5})
+    feed.publish("categories", "INSERT", {"id": 2, "name": "Garden"})
+    feed.flush()
+
+    catalog = cache.get()
+    assert catalog.get(2)["name"] == "Teapot" and catalog.get(2)["price"] == 9.5
+    assert catalog.get(6)["name"] == "Kettle"
+    assert catalog.get(5) is None
+    assert "Garden" in catalog.category_by_name
+    assert catalog.search_index.search_ids("teapot") == ["2"]
+    # Live: patched in place, never reloaded despite ttl=0
+    assert len(loads) == 1 and cache.stats()["changes_applied"] == 4
+
+
+def test_failed_batch_falls_back_to_reloading():
+    loads = []
+    cache = _cache(loads)
+    cache.get()
+    feed = CatalogFeed(cache)
+    feed.start()
+
+    feed.publish("products", "UPDATE", {"name": "no id"})
+    feed.flush()
+
+    assert not cache.live
+    cache.get()
+    assert len(loads) == 2
+
+
+def test_changes_during_a_reload_are_replayed_on_the_new_snapshot():
+    rows = [dict(p) for p in PRODUCTS]
+    read, release = threading.Event(), threading.Event()
+
+    def loader():
+        snapshot = [dict(p) for p in rows]  # read before the change below commits
+        read.set()
+        release.wait()
+        return Catalog([], snapshot)
+
+    cache = CatalogCache(loader)
+    release.set()
+    cache.get()
+    read.clear()
+    release.clear()
+
+    reload = threading.Thread(target=cache.reload)
+    reload.start()
+    read.wait()
+    rows[0]["price"] = 99.0
+    cache.apply_changes([
+        ("products", "UPDATE", dict(rows[0]), None),
+        ("products", "DELETE", None, {"id": 5}),
+    ])
+    release.set()
+    reload.join()
+
+    catalog = cache.get()
+    assert catalog.get(1)["price"] == 99.0
+    assert catalog.get(5) is None
@@ -0,0 +1,135 @@
+# tests/test_pricing.py
+"""The app's cart pricing (pricing.py) must match what place_order charges.
+
+The server side is memory_backend.py's mirror of sql/pricing.sql and
+sql/place_order.sql; the hand-worked case pins both to the SQL semantics.
+"""
+import uuid
+
+import pytest
+
+import memory_backend
+from catalog import Catalog
+from pricing import PricingRule, _price
+
+PRODUCTS = [
+    {"id": 1, "name": "Mug", "price": 19.99, "category_id": 1},
+    {"id": 2, "name": "Tea", "price": 5.05, "category_id": 2},
+    {"id": 3, "name": "Pot", "price": 42.5, "category_id": 2},
+    {"id": 4, "name": "Spoon", "price": 0.99, "category_id": 3},
+]
+
+RULES = {
+    "none": [],
+    "percent": [
+        {"id": 1, "position": 0, "kind": "percent_off", "percent": 10, "min_subtotal": 50, "label": "10% off"},
+    ],
+    "category": [
+        {"id": 1, "position": 0, "kind": "category_percent_off", "percent": 15, "category_id": "2",
+         "label": "Tea week"},
+    ],
+    "tax": [
+        {"id": 1, "position": 0, "kind": "tax", "percent": 12.5, "label": "VAT"},
+    ],
+    "all": [
+        {"id": 3, "position": 2, "kind": "tax", "percent": 12.5, "label": "VAT"},
+        {"id": 1, "position": 0, "kind": "percent_off", "percent": 10, "min_subtotal": 50, "label": "10% off"},
+        {"id": 2, "position": 1, "kind": "category_percent_off", "percent": 15, "category_id": "2",
+         "label": "Tea week"},
+        {"id": 4, "position": 1, "kind": "percent_off", "percent": 50, "min_subtotal": 1000, "label": "Never"},
+    ],
+}
+
+CARTS = [
+    {"1": 3, "2": 1},
+    {"2": 7, "3": 1, "4": 3},
+    {"4": 1},
+    {"1": 1, "9": 2},  # 9 isn't in the catalog
+]
+
+
+def _store(rules):
+    tables = {"products": [dict(p) for p in PRODUCTS], "categories": [], "pricing_rules": [dict(r) for r in rules]}
+    return memory_backend.MemoryStore(tables)
+
+
+def _catalog(store):
+    rules = sorted(store.tables["pricing_rules"], key=lambda r: (r["position"], r["id"]))
+    return Catalog([], store.tables["products"], pricing_rules=[PricingRule.from_row(r) for r in rules])
+
+
+@pytest.mark.parametrize("cart", CARTS)
+@pytest.mark.parametrize("rules", list(RULES))
+def test_cart_price_matches_price_items(rules, cart):
+    store = _store(RULES[rules])
+    snapshot = _price(cart, _catalog(store))
+    server = store.client().rpc("price_items", {"p_items": snapshot.items()}).execute().data
+
+    assert snapshot.subtotal == server["subtotal"]
+    assert list(snapshot.adjustments) == [(a["label"], a["amount"]) for a in server["adjustments"]]
+    assert snapshot.total == server["total"]
+
+
+@pytest.mark.parametrize("cart", CARTS)
+@pytest.mark.parametrize("rules", list(RULES))
+def test_place_order_accepts_the_snapshot_total(rules, cart):
+    store = _store(RULES[rules])
+    snapshot = _price(cart, _catalog(store))
+    client = store.client()
+    store.add_user("buyer@example.com", "secret")
+    client.auth.sign_in_with_password({"email": "buyer@example.com", "password": "secret"})
+
+    result = client.rpc("place_order", {
+        "p_idempotency_key": str(uuid.uuid4()),
+        "p_items": snapshot.items(),
+        "p_payment_method": "Card",
+        "p_expected_total": snapshot.total,
+    }).execute().data
+
+    assert not result["duplicate"]
+    assert store.tables["orders"][-1]["total"] == snapshot.total
+
+
+def test_rules_follow_price_items_arithmetic():
+    # Worked through sql/pricing.sql by hand: each step rounds half away from zero
+    snapshot = _price({"1": 3, "2": 1}, _catalog(_store(RULES["all"])))
+
+    assert snapshot.subtotal == 65.02                 # 3 × 19.99 + 5.05
+    assert snapshot.adjustments == (
+        ("10% off", -6.50),                           # 65.02 × 10% = 6.502
+        ("Tea week", -0.76),                          # 5.05 × 15% = 0.7575
+        ("VAT", 7.22),                                # 57.76 × 12.5% = 7.22
+    )
+    assert snapshot.total == 64.98
+
+
+def test_category_rule_with_text_category_ids():
+    # uuid category ids make category_id a text column
+    tea = "5b0f3c2e-8d0c-4d7e-9f55-0c6d2f1a9e11"
+    store = _store([{"id": 1, "position": 0, "kind": "category_percent_off", "percent": 50,
+                     "category_id": tea, "label": "Half-price tea"}])
+    for p in store.tables["products"]:
+        p["category_id"] = tea if p["category_id"] == 2 else f"other-{p['category_id']}"
+    cart = {"2": 2, "1": 1}
+    snapshot = _price(cart, _catalog(store))
+    server = store.client().rpc("price_items", {"p_items": snapshot.items()}).execute().data
+
+    assert snapshot.adjustments == (("Half-price tea", -5.05),)
+    assert snapshot.total == server["total"] == 25.04   # 19.99 + 2 × 5.05 - 5.05
+
+
+def test_place_order_skips_unknown_products_and_empty_lines():
+    store = _store([])
+    client = store.client()
+    store.add_user("buyer@example.com", "secret")
+    client.auth.sign_in_with_password({"email": "buyer@example.com", "password": "secret"})
+
+    client.rpc("place_order", {
+        "p_idempotency_key": str(uuid.uuid4()),
+        "p_items": [{"product_id": "1", "quantity": 2}, {"product_id": "99", "quantity": 1},
+                    {"product_id": "2", "quantity": 0}],
+        "p_payment_method": "Card",
+    }).execute()
+
+    assert [(i["product_id"], i["quantity"]) for i in store.tables["order_items"]] == [(1, 2)]
+    assert store.tables["orders"][-1]["total"] == 39.98
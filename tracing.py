@@ -0,0 +1,456 @@
+# tracing.py
+"""Request-level tracing of Supabase calls and script reruns.
+
+With ``TRACING = true`` every client from supabase_config is wrapped so each
+request records a span (table, operation, rows, bytes, latency), and
+main.py records a span per script or fragment rerun; requests made on the
+script thread become children of the rerun that made them. Spans feed
+cumulative aggregates (the Tracing page) and, optionally, a Prometheus
+``/metrics`` endpoint and an OTLP/HTTP collector.
+"""
+import functools
+import json
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import streamlit as st
+
+TRACING = bool(st.secrets.get("TRACING", False))
+BUFFER_SIZE = int(st.secrets.get("TRACING_BUFFER", 5000))  # recent spans kept for the Tracing page
+PROMETHEUS_PORT = int(st.secrets.get("TRACING_PROMETHEUS_PORT", 0))  # 0 = off
+OTLP_ENDPOINT = st.secrets.get("TRACING_OTLP_ENDPOINT", "")  # e.g. "http://localhost:4318/v1/traces"
+OTLP_INTERVAL_SECONDS = float(st.secrets.get("TRACING_OTLP_INTERVAL_SECONDS", 5))
+
+# Query builder methods that name the operation; everything else is a filter or modifier
+OPERATIONS = {"select", "insert", "update", "upsert", "delete"}
+# Auth methods that make a request
+AUTH_CALLS = {"sign_up", "sign_in_with_password", "sign_out", "refresh_session"}
+# Upper bounds (seconds) of the rerun latency histogram
+RERUN_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+_local = threading.local()
+
+
+def _new_id(nbytes):
+    return os.urandom(nbytes).hex()
+
+
+class Tracer:
+    """Collects spans and keeps cumulative aggregates for the whole process."""
+
+    def __init__(self, buffer_size=BUFFER_SIZE):
+        self.spans = deque(maxlen=buffer_size)
+        self._lock = threading.Lock()
+        self._export_queue = deque(maxlen=buffer_size)
+        # (table, op) -> totals
+        self.requests = defaultdict(lambda: {"count": 0, "errors": 0, "seconds": 0.0, "rows": 0, "bytes": 0})
+        # rerun name -> totals
+        self.reruns = defaultdict(lambda: {"count": 0, "interrupted": 0, "seconds": 0.0, "queries": 0,
+                                           "buckets": [0] * len(RERUN_BUCKETS)})
+
+    def start(self, name, kind, **attributes):
+        parent = getattr(_local, "stack", None)
+        parent = parent[-1] if parent else None
+        return {
+            "name": name,
+            "kind": kind,
+            "trace_id": parent["trace_id"] if parent else _new_id(16),
+            "span_id": _new_id(8),
+            "parent_id": parent["span_id"] if parent else None,
+            "start": time.time(),
+            "_t0": time.perf_counter(),
+            "queries": 0,
+            "status": "ok",
+            **attributes,
+        }
+
+    def finish(self, span, status=None):
+        span["duration_ms"] = (time.perf_counter() - span.pop("_t0")) * 1000
+        if status:
+            span["status"] = status
+        with self._lock:
+            if span["kind"] == "supabase":
+                totals = self.requests[span["table"], span["op"]]
+                totals["count"] += 1
+                totals["errors"] += span["status"] != "ok"
+                totals["seconds"] += span["duration_ms"] / 1000
+                totals["rows"] += span.get("rows", 0)
+                totals["bytes"] += span.get("bytes", 0)
+            else:
+                totals = self.reruns[span["name"]]
+                totals["count"] += 1
+                totals["queries"] += span["queries"]
+                if span["status"] == "interrupted":
+                    totals["interrupted"] += 1
+                else:
+                    seconds = span["duration_ms"] / 1000
+                    totals["seconds"] += seconds
+                    for i, bound in enumerate(RERUN_BUCKETS):
+                        if seconds <= bound:
+                            totals["buckets"][i] += 1
+            self.spans.append(span)
+            if OTLP_ENDPOINT:
+                self._export_queue.append(span)
+
+    @contextmanager
+    def span(self, name, kind, **attributes):
+        """Time the block as a span; Supabase spans count towards their parent rerun."""
+        stack = _local.__dict__.setdefault("stack", [])
+        if stack and "duration_ms" in stack[0]:
+            stack.clear()  # left over from a run that was cut short on this thread
+        span = self.start(name, kind, **attributes)
+        if kind == "supabase" and stack:
+            stack[-1]["queries"] += 1
+        stack.append(span)
+        try:
+            yield span
+        except Exception as e:  # st.rerun()/st.stop() are BaseExceptions and stay "ok"
+            span["status"] = "error"
+            span["error"] = repr(e)
+            raise
+        finally:
+            stack.pop()
+            self.finish(span)
+
+    def take_export_batch(self):
+        with self._lock:
+            batch = list(self._export_queue)
+            self._export_queue.clear()
+        return batch
+
+
+@st.cache_resource
+def get_tracer() -> Tracer:
+    tracer = Tracer()
+    if PROMETHEUS_PORT:
+        _serve_prometheus(tracer, PROMETHEUS_PORT)
+    if OTLP_ENDPOINT:
+        threading.Thread(target=_otlp_loop, args=(tracer,), daemon=True, name="otlp-export").start()
+    return tracer
+
+
+# --- Client wrapper ---
+
+def _response_size(data):
+    try:
+        return len(json.dumps(data, default=str))
+    except (TypeError, ValueError):
+        return 0
+
+
+class _TracedRequest:
+    """Proxy for a query/RPC builder that traces ``execute()``."""
+
+    def __init__(self, tracer, builder, table, op):
+        self._tracer = tracer
+        self._builder = builder
+        self._table = table
+        self._op = op
+
+    def __getattr__(self, name):
+        attr = getattr(self._builder, name)
+        if not callable(attr):
+            return attr
+
+        @functools.wraps(attr)
+        def call(*args, **kwargs):
+            result = attr(*args, **kwargs)
+            if hasattr(result, "execute"):
+                op = name if name in OPERATIONS else self._op
+                return _TracedRequest(self._tracer, result, self._table, op)
+            return result
+        return call
+
+    def execute(self):
+        with self._tracer.span(f"{self._op} {self._table}", "supabase", table=self._table, op=self._op) as span:
+            res = self._builder.execute()
+            data = getattr(res, "data", None)
+            span["rows"] = len(data) if isinstance(data, list) else int(data is not None)
+            span["bytes"] = _response_size(data)
+            return res
+
+
+class _TracedAuth:
+    def __init__(self, tracer, auth):
+        self._tracer = tracer
+        self._auth = auth
+
+    def __getattr__(self, name):
+        attr = getattr(self._auth, name)
+        if name not in AUTH_CALLS:
+            return attr
+
+        @functools.wraps(attr)
+        def call(*args, **kwargs):
+            with self._tracer.span(f"auth {name}", "supabase", table="auth", op=name):
+                return attr(*args, **kwargs)
+        return call
+
+
+class TracedClient:
+    """Wraps a Supabase (or memory backend) client so every request is traced."""
+
+    def __init__(self, client, tracer):
+        self._client = client
+        self._tracer = tracer
+        self.auth = _TracedAuth(tracer, client.auth)
+
+    def table(self, name):
+        return _TracedRequest(self._tracer, self._client.table(name), name, "select")
+
+    from_ = table
+
+    def rpc(self, name, params=None, **kwargs):
+        return _TracedRequest(self._tracer, self._client.rpc(name, params or {}, **kwargs), name, "rpc")
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+
+def trace_client(client):
+    return TracedClient(client, get_tracer()) if TRACING else client
+
+
+# --- Rerun spans ---
+
+def start_rerun(name="main"):
+    """Open the span for this script run; pair with :func:`end_rerun`.
+
+    A run cut short by ``st.rerun()`` or an exception never reaches
+    end_rerun; the next run records it as ``interrupted``.
+    """
+    if not TRACING:
+        return
+    tracer = get_tracer()
+    previous = st.session_state.pop("_trace_rerun", None)
+    if previous:
+        tracer.finish(previous, status="interrupted")
+    span = tracer.start(name, "rerun")
+    _local.stack = [span]
+    st.session_state["_trace_rerun"] = span
+
+
+def end_rerun():
+    if not TRACING:
+        return
+    span = st.session_state.pop("_trace_rerun", None)
+    _local.stack = []
+    if span:
+        get_tracer().finish(span)
+
+
+def traced_rerun(name):
+    """Decorator recording a span each time a fragment (or any function) runs."""
+    def decorate(fn):
+        if not TRACING:
+            return fn
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with get_tracer().span(name, "rerun"):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+# --- Exporters ---
+
+def prometheus_text(tracer):
+    """Current aggregates in the Prometheus text exposition format."""
+    lines = [
+        "# TYPE supabase_requests_total counter",
+        "# TYPE supabase_request_errors_total counter",
+        "# TYPE supabase_request_seconds_total counter",
+        "# TYPE supabase_rows_total counter",
+        "# TYPE supabase_response_bytes_total counter",
+    ]
+    with tracer._lock:
+        requests = {k: dict(v) for k, v in tracer.requests.items()}
+        reruns = {k: dict(v, buckets=list(v["buckets"])) for k, v in tracer.reruns.items()}
+    for (table, op), t in sorted(requests.items()):
+        labels = f'table="{table}",op="{op}"'
+        lines += [
+            f"supabase_requests_total{{{labels}}} {t['count']}",
+            f"supabase_request_errors_total{{{labels}}} {t['errors']}",
+            f"supabase_request_seconds_total{{{labels}}} {t['seconds']:.6f}",
+            f"supabase_rows_total{{{labels}}} {t['rows']}",
+            f"supabase_response_bytes_total{{{labels}}} {t['bytes']}",
+        ]
+    lines += ["# TYPE streamlit_rerun_seconds histogram",
+              "# TYPE streamlit_rerun_queries_total counter",
+              "# TYPE streamlit_rerun_interrupted_total counter"]
+    for name, t in sorted(reruns.items()):
+        completed = t["count"] - t["interrupted"]
+        for bound, count in zip(RERUN_BUCKETS, t["buckets"]):
+            lines.append(f'streamlit_rerun_seconds_bucket{{name="{name}",le="{bound}"}} {count}')
+        lines += [
+            f'streamlit_rerun_seconds_bucket{{name="{name}",le="+Inf"}} {completed}',
+            f'streamlit_rerun_seconds_sum{{name="{name}"}} {t["seconds"]:.6f}',
+            f'streamlit_rerun_seconds_count{{name="{name}"}} {completed}',
+            f'streamlit_rerun_queries_total{{name="{name}"}} {t["queries"]}',
+            f'streamlit_rerun_interrupted_total{{name="{name}"}} {t["interrupted"]}',
+        ]
+    return "\n".join(lines) + "\n"
+
+
+def _serve_prometheus(tracer, port):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path != "/metrics":
+                self.send_error(404)
+                return
+            body = prometheus_text(tracer).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True, name="prometheus").start()
+
+
+def _otlp_value(value):
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def otlp_payload(spans):
+    """Spans as an OTLP/HTTP JSON ``ExportTraceServiceRequest``."""
+    skip = {"name", "kind", "trace_id", "span_id", "parent_id", "start", "duration_ms", "status", "error"}
+    out = []
+    for s in spans:
+        start_ns = int(s["start"] * 1e9)
+        otlp = {
+            "traceId": s["trace_id"],
+            "spanId": s["span_id"],
+            "name": s["name"],
+            "kind": 3 if s["kind"] == "supabase" else 1,  # CLIENT / INTERNAL
+            "startTimeUnixNano": str(start_ns),
+            "endTimeUnixNano": str(start_ns + int(s["duration_ms"] * 1e6)),
+            "attributes": [{"key": f"app.{k}", "value": _otlp_value(v)}
+                           for k, v in s.items()
+                           if k not in skip and v is not None and not (k == "queries" and s["kind"] == "supabase")],
+            "status": {"code": 2, "message": s.get("error", "")} if s["status"] == "error" else {"code": 1},
+        }
+        if s["parent_id"]:
+            otlp["parentSpanId"] = s["parent_id"]
+        out.append(otlp)
+    return {"resourceSpans": [{
+        "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": "my-online-store"}}]},
+        "scopeSpans": [{"scope": {"name": "tracing"}, "spans": out}],
+    }]}
+
+
+def _otlp_loop(tracer):
+    from supabase_config import get_http_pool
+
+    while True:
+        time.sleep(OTLP_INTERVAL_SECONDS)
+        batch = tracer.take_export_batch()
+        if not batch:
+            continue
+        try:
+            get_http_pool().post(OTLP_ENDPOINT, json=otlp_payload(batch))
+        except Exception:
+            pass  # collector down: drop this batch rather than grow without bound
+
+
+# --- Tracing page ---
+
+def _percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))] if ordered else 0
+
+
+def show_tracing():
+    import pandas as pd
+
+    st.title("Tracing")
+    st.caption("Supabase requests and reruns recorded by this server process.")
+
+    if not TRACING:
+        st.info("Tracing is off. Set `TRACING = true` in Streamlit secrets to record spans.")
+        return
+
+    tracer = get_tracer()
+    with tracer._lock:
+        spans = list(tracer.spans)
+        requests = {k: dict(v) for k, v in tracer.requests.items()}
+        reruns = {k: dict(v) for k, v in tracer.reruns.items()}
+
+    latencies = defaultdict(list)
+    for s in spans:
+        if s["status"] != "interrupted":
+            key = (s["table"], s["op"]) if s["kind"] == "supabase" else s["name"]
+            latencies[key].append(s["duration_ms"])
+
+    st.subheader("🔁 Reruns")
+    if reruns:
+        st.dataframe(pd.DataFrame([
+            {
+                "rerun": name,
+                "count": t["count"],
+                "interrupted": t["interrupted"],
+                "p50 ms": _percentile(latencies[name], 50),
+                "p95 ms": _percentile(latencies[name], 95),
+                "queries / rerun": t["queries"] / t["count"],
+            }
+            for name, t in sorted(reruns.items())
+        ]), hide_index=True)
+    else:
+        st.info("No reruns recorded yet.")
+
+    st.subheader("🗄️ Supabase requests")
+    if requests:
+        st.dataframe(pd.DataFrame([
+            {
+                "table": table,
+                "op": op,
+                "count": t["count"],
+                "errors": t["errors"],
+                "p50 ms": _percentile(latencies[table, op], 50),
+                "p95 ms": _percentile(latencies[table, op], 95),
+                "total s": t["seconds"],
+                "rows": t["rows"],
+                "KB": t["bytes"] / 1024,
+            }
+            for (table, op), t in sorted(requests.items(), key=lambda kv: -kv[1]["seconds"])
+        ]), hide_index=True)
+    else:
+        st.info("No requests recorded yet.")
+
+    st.subheader("🕒 Recent spans")
+    recent = [
+        {
+            "span": s["name"],
+            "kind": s["kind"],
+            "ms": s["duration_ms"],
+            "rows": s.get("rows"),
+            "queries": s["queries"] if s["kind"] == "rerun" else None,
+            "status": s["status"],
+            "trace": s["trace_id"][:8],
+        }
+        for s in reversed(spans[-200:])
+    ]
+    st.dataframe(pd.DataFrame(recent), hide_index=True)
+
+    exports = []
+    if PROMETHEUS_PORT:
+        exports.append(f"Prometheus: http://127.0.0.1:{PROMETHEUS_PORT}/metrics")
+    if OTLP_ENDPOINT:
+        exports.append(f"OTLP: {OTLP_ENDPOINT}")
+    if exports:
+        st.caption(" · ".join(exports))